@@ -1,18 +1,43 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
-from pydantic import BaseModel
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+import asyncio
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError
+import hashlib
 import os
-import logging
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Dict, List, Literal
+from sqlalchemy.exc import IntegrityError
 
-from config import logger, REPORTS_DIR
+from config import (logger, REPORTS_DIR, STREAM_MAX_ROWS, TASK_BATCH_LIMIT, REPORT_BODY_MAX_BYTES,
+                    BALANCE_COMPACT_INTERVAL, BALANCE_COMPACT_BATCH, REPORT_SWEEP_INTERVAL,
+                    REPORT_SENDFILE, REPORT_ACCEL_PREFIX)
 from excel_service import create_excel_report
-from excel_service2 import create_excel_report2
-from excel_service3 import create_excel_report3
-from data_service import get_total
-app = FastAPI()
+from excel_service2 import create_excel_report2, render_report2_bytes
+from report_export import create_report_export, render_export_bytes, parquet_available
+from report_upload import create_report_from_upload, spool_upload, msgpack_uploads_available
+from task_service import create_tasks
+from report_executor import report_executor, ReportQueueFull, BrokenProcessPool
+import job_registry
+import report_cache
+import report_metrics
+import report_snapshot
+import balance_ledger
+import report_codec
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded by report_codec, msgspec when it is installed"""
+
+    def render(self, content) -> bytes:
+        return report_codec.encode(content)
+
+
+app = FastAPI(default_response_class=FastJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000","https://bank.ocean00.com","http://bank.ocean00.com"],  # Allow requests from this origin
@@ -26,6 +51,9 @@ class ReportRequest(BaseModel):
     start_date: str = None  # Format: YYYY-MM-DD
     end_date: str = None    # Format: YYYY-MM-DD
     reportdata: Optional[Dict[Any, Any]] = None
+    banks_per_sheet: Optional[int] = Field(None, ge=1)  # Split banks over sheets of this many, after a Summary sheet
+    format: Literal["xlsx", "csv", "parquet"] = "xlsx"  # csv/parquet: one flat row per task, no styling
+    _body_sha256: Optional[str] = PrivateAttr(None)  # Of the decompressed body, set by read_report_request
     def get_date_range(self):
         """Convert date strings to proper datetime format with time"""
         today = datetime.now().strftime('%Y-%m-%d')
@@ -40,64 +68,473 @@ class ReportRequest(BaseModel):
         
         return (start_datetime, end_datetime)
 
+async def read_report_request(request: Request) -> ReportRequest:
+    """ReportRequest from the body, with reportdata decoded and checked by report_codec in one pass
+
+    The body is JSON or MessagePack, optionally gzip or zstd compressed. Only the small
+    fields go through pydantic; validating reportdata as Dict[Any, Any] would copy the
+    whole payload again.
+    """
+    try:
+        chunks = report_codec.decode_body(request.stream(), request.headers.get("content-encoding"),
+                                          REPORT_BODY_MAX_BYTES)
+        body = b"".join([chunk async for chunk in chunks])
+        # Decoding a large body takes a while, so do it off the event loop like the hashing below
+        data = await run_in_threadpool(report_codec.decode_report_request, body, request.headers.get("content-type"))
+    except report_codec.UnsupportedBody as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except report_codec.BodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except report_codec.DecodeError as e:
+        raise RequestValidationError([{"loc": ("body",), "msg": str(e), "type": "value_error.jsondecode"}])
+    reportdata = data.pop("reportdata", None)
+    try:
+        report_request = ReportRequest(**data)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body",) + tuple(error["loc"])} for error in e.errors()])
+    report_request.reportdata = reportdata
+    # hashlib releases the GIL, so polling requests keep being served while a large body is hashed
+    report_request._body_sha256 = (await run_in_threadpool(hashlib.sha256, body)).hexdigest()
+    return report_request
+
+class TaskBatchRequest(BaseModel):
+    tasks: List[Dict[str, Any]]
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MEDIA_TYPES = {
+    "xlsx": XLSX_MEDIA_TYPE,
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def count_rows(reportdata):
+    """Number of tasks across all banks of a reportdata payload"""
+    accounts = reportdata.get("result", []) if reportdata else []
+    return sum(len(account.get("tasks") or []) for account in accounts)
+
+def check_format(request):
+    """Reject an export format this server cannot write"""
+    if request.format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export is not available on this server")
+
+def pool_unavailable(e):
+    """HTTPException for a report the worker pool could not take"""
+    if isinstance(e, ReportQueueFull):
+        return HTTPException(status_code=429, detail="Too many reports in progress, try again later",
+                             headers={"Retry-After": "30"})
+    return HTTPException(status_code=503, detail="Report workers are restarting, try again later",
+                         headers={"Retry-After": "5"})
+
+def submit_job(report_id, fn, *args, **kwargs):
+    """Run a registered job's report function on the worker pool
+
+    A job that cannot be queued is removed from the registry. One whose worker dies, so
+    that run_job never records the outcome, is marked failed when its future completes.
+    """
+    try:
+        future = report_executor.submit(job_registry.run_job, report_id, fn, *args, **kwargs)
+    except Exception as e:
+        job_registry.delete_job(report_id)
+        logger.warning(f"Rejecting report_id {report_id}: {str(e)}")
+        if isinstance(e, (ReportQueueFull, BrokenProcessPool)):
+            raise pool_unavailable(e)
+        raise
+    future.add_done_callback(lambda future: finish_job(report_id, future))
+    return future
+
+def finish_job(report_id, future):
+    """Done callback of a job's future: fail the job if its worker could not finish it, then record metrics"""
+    error = "cancelled" if future.cancelled() else future.exception()
+    if error is not None:
+        try:
+            if job_registry.fail_unfinished(report_id, f"Report worker failed: {str(error)}"):
+                logger.error(f"Report worker for report_id {report_id} failed: {str(error)}")
+        except Exception as e:
+            logger.error(f"Error failing report_id {report_id}: {str(e)}")
+    record_job_metrics(report_id)
+
+def record_job_metrics(report_id):
+    """Add a finished job's metrics from the registry to the /metrics totals"""
+    try:
+        job = job_registry.get_job(report_id)
+        if job is not None:
+            report_metrics.record_job(job["state"], job_registry.job_metrics(job))
+    except Exception as e:
+        logger.error(f"Error recording metrics for report_id {report_id}: {str(e)}")
+
 @app.post("/generate-excel")
-async def generate_excel(request: ReportRequest, background_tasks: BackgroundTasks):
+async def generate_excel(request: ReportRequest = Depends(read_report_request)):
+    check_format(request)
     try:
-        report_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        report_id = job_registry.new_report_id()
         date_range = request.get_date_range()
         
         # Check if data exists for the date range by getting the totals
        
             
-        logger.info(f"Starting background task for report_id: {report_id} with date range: {date_range}")
+        date_range_response = {
+            "start_date": request.start_date or datetime.now().strftime('%Y-%m-%d'),
+            "end_date": request.end_date or datetime.now().strftime('%Y-%m-%d')
+        }
+
+        # The same body gives the same workbook, so reuse a finished or in-flight job.
+        # Keyed on the body's hash: serializing a large reportdata again would stall the event loop
+        cache_key = report_cache.cache_key(date_range, {
+            "body_sha256": request._body_sha256,
+            "banks_per_sheet": request.banks_per_sheet,
+            "format": None if request.format == "xlsx" else request.format,
+        })
+        cached = await run_in_threadpool(report_cache.lookup, cache_key)
+        if cached is not None:
+            return {
+                "status": "completed" if cached["state"] == job_registry.DONE else "processing",
+                "report_id": cached["report_id"],
+                "message": "Report already generated",
+                "cached": True,
+                "date_range": date_range_response
+            }
+
+        logger.info(f"Queueing report_id: {report_id} with date range: {date_range}")
         
-        background_tasks.add_task(create_excel_report2, report_id, date_range,reportdata=request.reportdata)
+        row_count = count_rows(request.reportdata)
+        await run_in_threadpool(job_registry.create_job, report_id, date_range, row_count, cache_key)
+        if request.format == "xlsx":
+            # Streamed row by row; the same cells as the in-memory workbook at a fraction of the memory
+            fn, options = create_excel_report2, {"write_only": True, "banks_per_sheet": request.banks_per_sheet}
+        else:
+            fn, options = create_report_export, {"format": request.format}
+        submit_job(report_id, fn, report_id, date_range, reportdata=request.reportdata, **options)
         
         return {
             "status": "processing",
             "report_id": report_id,
             "message": "Report generation started",
-            "date_range": {
-                "start_date": request.start_date or datetime.now().strftime('%Y-%m-%d'),
-                "end_date": request.end_date or datetime.now().strftime('%Y-%m-%d')
-            }
+            "date_range": date_range_response
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in generate-excel endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-excel/stream")
+async def generate_excel_stream(request: ReportRequest = Depends(read_report_request)):
+    """Return the workbook in the response body, or fall back to the job queue for large payloads"""
+    check_format(request)
+    row_count = count_rows(request.reportdata)
+    if row_count > STREAM_MAX_ROWS:
+        logger.info(f"{row_count} rows is above STREAM_MAX_ROWS, queueing instead of streaming")
+        return FastJSONResponse(status_code=202, content=await generate_excel(request))
+
+    try:
+        date_range = request.get_date_range()
+        try:
+            if request.format == "xlsx":
+                future = report_executor.submit(render_report2_bytes, date_range, reportdata=request.reportdata,
+                                                banks_per_sheet=request.banks_per_sheet)
+            else:
+                future = report_executor.submit(render_export_bytes, reportdata=request.reportdata,
+                                                format=request.format)
+            content = await asyncio.wrap_future(future)
+        except (ReportQueueFull, BrokenProcessPool) as e:
+            logger.warning(f"Rejecting streamed report: {str(e)}")
+            raise pool_unavailable(e)
+
+        filename = f"financial_report_{job_registry.new_report_id()}.{request.format}"
+        return Response(
+            content,
+            media_type=MEDIA_TYPES[request.format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in generate-excel/stream endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate-excel/upload")
+async def generate_excel_upload(request: Request, start_date: str = None, end_date: str = None,
+                                format: Literal["xlsx", "csv", "parquet"] = "xlsx",
+                                banks_per_sheet: Optional[int] = Query(None, ge=1)):
+    """Queue a report from a raw reportdata body, which is spooled to disk rather than parsed here
+
+    The body is JSON or MessagePack, optionally gzip or zstd compressed; it is decompressed
+    as it arrives. The report worker reads the file incrementally, one bank at a time.
+    """
+    query = {"start_date": start_date, "end_date": end_date, "format": format, "banks_per_sheet": banks_per_sheet}
+    options = ReportRequest(**{name: value for name, value in query.items() if value is not None})
+    check_format(options)
+    suffix = ".json"
+    if report_codec.media_type(request.headers.get("content-type")) in report_codec.MSGPACK_TYPES:
+        if not msgpack_uploads_available():
+            raise HTTPException(status_code=415, detail="MessagePack uploads are not supported on this server")
+        suffix = ".msgpack"
+    try:
+        chunks = report_codec.decode_body(request.stream(), request.headers.get("content-encoding"),
+                                          REPORT_BODY_MAX_BYTES)
+        path, digest = await spool_upload(chunks, suffix)
+    except report_codec.UnsupportedBody as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except report_codec.BodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except report_codec.DecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    queued = False
+    try:
+        report_id = job_registry.new_report_id()
+        date_range = options.get_date_range()
+        date_range_response = {
+            "start_date": start_date or datetime.now().strftime('%Y-%m-%d'),
+            "end_date": end_date or datetime.now().strftime('%Y-%m-%d')
+        }
+
+        # Keyed on the body's hash, so the same upload reuses its report like /generate-excel
+        cache_key = report_cache.cache_key(date_range, {
+            "upload_sha256": digest,
+            "banks_per_sheet": banks_per_sheet,
+            "format": None if format == "xlsx" else format,
+        })
+        cached = await run_in_threadpool(report_cache.lookup, cache_key)
+        if cached is not None:
+            return {
+                "status": "completed" if cached["state"] == job_registry.DONE else "processing",
+                "report_id": cached["report_id"],
+                "message": "Report already generated",
+                "cached": True,
+                "date_range": date_range_response
+            }
+
+        logger.info(f"Queueing report_id: {report_id} from upload with date range: {date_range}")
+        await run_in_threadpool(job_registry.create_job, report_id, date_range, None, cache_key)
+        submit_job(report_id, create_report_from_upload, report_id, date_range, path, format=format,
+                   banks_per_sheet=banks_per_sheet)
+        queued = True
+
+        return {
+            "status": "processing",
+            "report_id": report_id,
+            "message": "Report generation started",
+            "date_range": date_range_response
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in generate-excel/upload endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # The worker removes the file once it is queued; a cache hit or an error leaves it to us
+        if not queued and os.path.exists(path):
+            os.remove(path)
+
+def get_job_status(report_id):
+    """Job record for /report-status, with a done job whose file was deleted outside the sweeper marked expired"""
+    job = job_registry.get_job(report_id)
+    if job is None or job["state"] != job_registry.DONE:
+        return job
+    if not os.path.exists(os.path.join(REPORTS_DIR, job["filename"])):
+        job_registry.mark_expired(report_id)
+        job["state"] = job_registry.EXPIRED
+    return job
+
 @app.get("/report-status/{report_id}")
 async def check_status(report_id: str):
     try:
-        filepath = os.path.join(REPORTS_DIR, f"financial_report_{report_id}.xlsx")
-        
-        if os.path.exists(filepath):
+        # Registry reads and the file check stay off the event loop, polls come in often
+        job = await run_in_threadpool(get_job_status, report_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Report not found")
+
+        status = {
+            "state": job["state"],
+            "row_count": job["row_count"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "metrics": job_registry.job_metrics(job),
+        }
+        if job["state"] == job_registry.DONE:
             return {
                 "status": "completed",
-                "filename": f"financial_report_{report_id}.xlsx",
-                "download_url": f"/reports/financial_report_{report_id}.xlsx"
+                "filename": job["filename"],
+                "download_url": f"/reports/{job['filename']}",
+                **status
+            }
+        if job["state"] == job_registry.EXPIRED:
+            return {
+                "status": "expired",
+                **status
+            }
+        if job["state"] == job_registry.FAILED:
+            return {
+                "status": "failed",
+                "error": job["error"],
+                **status
             }
         return {
-            "status": "processing"
+            "status": "processing",
+            **status
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error checking report status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Optional: Add an endpoint to serve the reports
+# Report files never change once their job is done, so caches may keep them as long as they like
+REPORT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header matches an ETag, compared weakly as RFC 9110 asks"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def not_modified_since(if_modified_since, mtime):
+    try:
+        return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+def report_etag(job, filepath):
+    """sha256 of a done job's file, hashed and stored now if it finished before reports were hashed
+
+    Also records the download for least recently used eviction.
+    """
+    sha256 = job["file_sha256"]
+    if sha256 is None:
+        sha256 = job_registry.file_sha256(filepath)
+        job_registry.set_file_sha256(job["report_id"], sha256)
+    job_registry.touch(job["report_id"])
+    return sha256
+
 @app.get("/reports/{filename}")
-async def get_report(filename: str):
+async def get_report(filename: str, request: Request):
+    """Download a done report, with conditional GET and Range requests"""
+    job = await run_in_threadpool(job_registry.find_done_job_by_filename, filename)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report not found")
     filepath = os.path.join(REPORTS_DIR, filename)
-    if not os.path.exists(filepath):
+    try:
+        stat_result = await run_in_threadpool(os.stat, filepath)
+    except FileNotFoundError:
+        await run_in_threadpool(job_registry.mark_expired, job["report_id"])
         raise HTTPException(status_code=404, detail="Report not found")
-    
-    # Return the file as a downloadable attachment
+    # Hashing and registry writes stay off the event loop, like the lookup above
+    sha256 = await run_in_threadpool(report_etag, job, filepath)
+
+    headers = {
+        "ETag": f'"{sha256}"',
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": REPORT_CACHE_CONTROL,
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, headers["ETag"])
+    else:
+        not_modified = not_modified_since(request.headers.get("if-modified-since"), stat_result.st_mtime)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    media_type = MEDIA_TYPES.get(os.path.splitext(filename)[1].lstrip("."), XLSX_MEDIA_TYPE)
+    if REPORT_SENDFILE in ("x-accel-redirect", "x-sendfile"):
+        # The web server sends the body and answers Range requests itself
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        if REPORT_SENDFILE == "x-accel-redirect":
+            headers["X-Accel-Redirect"] = REPORT_ACCEL_PREFIX + quote(filename)
+        else:
+            headers["X-Sendfile"] = filepath
+        return Response(headers=headers, media_type=media_type)
+
+    # Return the file as a downloadable attachment; FileResponse answers Range and If-Range
     return FileResponse(
         path=filepath,
         filename=filename,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        media_type=media_type,
+        headers=headers,
+        stat_result=stat_result
     )
 
+@app.post("/tasks/batch")
+async def create_task_batch(request: TaskBatchRequest):
+    """Create every task of the batch and its balance change in one transaction, or none of them"""
+    if not request.tasks:
+        raise HTTPException(status_code=400, detail="No tasks in batch")
+    if len(request.tasks) > TASK_BATCH_LIMIT:
+        raise HTTPException(status_code=413, detail=f"At most {TASK_BATCH_LIMIT} tasks per batch")
+    try:
+        result = await run_in_threadpool(create_tasks, request.tasks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        logger.warning(f"Rejected task batch: {str(e.orig)}")
+        raise HTTPException(status_code=409, detail="Task batch conflicts with existing data, nothing was created")
+    except Exception as e:
+        logger.error(f"Error in tasks/batch endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "created",
+        **result
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Report generation metrics in the Prometheus text format"""
+    report_files, report_bytes = await run_in_threadpool(job_registry.done_totals)
+    content = report_metrics.render_prometheus({
+        "report_executor_pending": ("Reports running or waiting for a worker.", report_executor.pending),
+        "report_files": ("Reports kept for download.", report_files),
+        "report_bytes": ("Bytes of reports kept for download.", report_bytes),
+    })
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+def start_job_registry():
+    job_registry.init_registry()
+    job_registry.fail_interrupted_jobs()
+
+async def compact_balances():
+    """Fold the balance ledger into Bank.balance until the API stops"""
+    while True:
+        try:
+            # Keep going while there is a backlog, then wait for more deltas
+            while await run_in_threadpool(balance_ledger.compact, BALANCE_COMPACT_BATCH) == BALANCE_COMPACT_BATCH:
+                pass
+        except Exception as e:
+            logger.error(f"Error compacting balance ledger: {str(e)}")
+        await asyncio.sleep(BALANCE_COMPACT_INTERVAL)
+
+@app.on_event("startup")
+async def start_balance_compactor():
+    app.state.balance_compactor = asyncio.create_task(compact_balances())
+
+async def sweep_reports():
+    """Apply the report retention policy every REPORT_SWEEP_INTERVAL seconds until the API stops"""
+    while True:
+        try:
+            await run_in_threadpool(report_cache.sweep)
+        except Exception as e:
+            logger.error(f"Error sweeping reports: {str(e)}")
+        try:
+            await run_in_threadpool(report_snapshot.expire_snapshots)
+        except Exception as e:
+            logger.error(f"Error expiring report snapshots: {str(e)}")
+        await asyncio.sleep(REPORT_SWEEP_INTERVAL)
+
+@app.on_event("startup")
+async def start_report_sweeper():
+    app.state.report_sweeper = asyncio.create_task(sweep_reports())
+
+@app.on_event("shutdown")
+def shutdown_report_executor():
+    report_executor.shutdown(wait=False)
+
+@app.on_event("shutdown")
+async def stop_balance_compactor():
+    app.state.balance_compactor.cancel()
+
+@app.on_event("shutdown")
+async def stop_report_sweeper():
+    app.state.report_sweeper.cancel()
+
 # Entry point
 if __name__ == "__main__":
     import uvicorn
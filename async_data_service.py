@@ -0,0 +1,110 @@
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import logger, ASYNC_DATABASE_URL
+from data_service import (ACCOUNTS_QUERY, BANKS_QUERY, BRANCHES_QUERY, TOTALS_QUERY,
+                          totals_dict, transactions2_statements)
+
+# asyncio counterparts of the data_service queries, so independent ones can run concurrently
+
+_engine = None
+
+def get_async_engine():
+    """Shared AsyncEngine, created on first use with the same pool limits as the sync engine"""
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=5, max_overflow=10)
+    return _engine
+
+async def dispose_async_engine():
+    """Close the pool; the next query opens a new one on the running event loop"""
+    global _engine
+    engine, _engine = _engine, None
+    if engine is not None:
+        await engine.dispose()
+
+async def get_accounts():
+    try:
+        async with get_async_engine().connect() as conn:
+            result = await conn.execute(text(ACCOUNTS_QUERY))
+            accounts = result.fetchall()
+            logger.info(f"Retrieved {len(accounts)} accounts")
+            return accounts
+    except Exception as e:
+        logger.error(f"Error retrieving accounts: {str(e)}")
+        raise
+
+async def get_banks(date_range):
+    try:
+        async with get_async_engine().connect() as conn:
+            start_date, end_date = date_range
+            result = await conn.execute(text(BANKS_QUERY), {"start_date": start_date, "end_date": end_date})
+            accounts = result.fetchall()
+            logger.info(f"Retrieved {len(accounts)} accounts")
+            return accounts
+    except Exception as e:
+        logger.error(f"Error retrieving accounts: {str(e)}")
+        raise
+
+async def get_transactions2(bank_id, date_range=None, batch_size=1000):
+    """A bank's transactions newest first, fetched in pages that seek on (updatedAt, id)"""
+    try:
+        async with get_async_engine().connect() as conn:
+            statement, next_statement, params = transactions2_statements(bank_id, date_range, batch_size)
+            all_transactions = []
+            while True:
+                batch = (await conn.execute(statement, params)).fetchall()
+                all_transactions.extend(batch)
+                if len(batch) < batch_size:
+                    break
+
+                last = batch[-1]
+                params["last_updated"] = last.updatedAt
+                params["last_id"] = last.id
+                statement = next_statement
+
+            logger.info(f"Retrieved {len(all_transactions)} transactions for bank_id {bank_id}")
+            return all_transactions
+    except Exception as e:
+        logger.error(f"Error retrieving transactions for bank_id {bank_id}: {str(e)}")
+        raise
+
+async def get_branches(date_range):
+    try:
+        async with get_async_engine().connect() as conn:
+            start_date, end_date = date_range
+            result = await conn.execute(text(BRANCHES_QUERY), {"start_date": start_date, "end_date": end_date})
+            branches = result.fetchall()
+            logger.info(f"Retrieved {len(branches)} branches for date range {date_range}")
+            return branches
+    except Exception as e:
+        logger.error(f"Error retrieving branches: {str(e)}")
+        raise
+
+async def get_total(date_range):
+    try:
+        async with get_async_engine().connect() as conn:
+            start_date, end_date = date_range
+            result = await conn.execute(text(TOTALS_QUERY), {"start_date": start_date, "end_date": end_date})
+            return totals_dict(result.one())
+    except Exception as e:
+        logger.error(f"Error retrieving task totals: {str(e)}")
+        raise
+
+async def fetch_report_inputs(date_range):
+    """(accounts, totals, branches) for the DB report, queried concurrently"""
+    accounts, totals, branches = await asyncio.gather(
+        get_accounts(), get_total(date_range), get_branches(date_range))
+    return accounts, totals, branches
+
+def load_report_inputs(date_range):
+    """fetch_report_inputs for synchronous callers such as the report workers"""
+    async def load():
+        try:
+            return await fetch_report_inputs(date_range)
+        finally:
+            # Pooled connections belong to this event loop, which asyncio.run closes
+            await dispose_async_engine()
+    return asyncio.run(load())
@@ -0,0 +1,76 @@
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import bindparam, column, select, table, text
+
+from config import engine, logger
+
+# Bank balances as Bank.balance plus the rows of the BankBalanceDelta ledger,
+# see migrations/002_bank_balance_delta.sql. Readers of a current balance add
+# SUM(BankBalanceDelta.amount) for the bank to Bank.balance
+
+# The columns compact locks, as a table so with_for_update renders for the current dialect
+LEDGER = table("BankBalanceDelta", column("id"), column("bankId"), column("amount"))
+
+INSERT_DELTA = text("""
+    INSERT INTO BankBalanceDelta (bankId, taskId, amount)
+    VALUES (:bankId, :taskId, :amount)
+""")
+
+def task_amount(amount):
+    """A task amount as a Decimal, from a number or a numeric string such as a serialized Prisma Decimal
+
+    Raises ValueError for anything else.
+    """
+    try:
+        value = Decimal(str(amount))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Task amount {amount!r} is not a number")
+    if not value.is_finite():
+        raise ValueError(f"Task amount {amount!r} is not a number")
+    return value
+
+def task_delta(task_data):
+    """Balance change of a task: deposits add, withdrawals subtract, other types none"""
+    if task_data["type"] == "WITHDRAW":
+        return -task_amount(task_data["amount"])
+    if task_data["type"] == "DEPOSIT":
+        return task_amount(task_data["amount"])
+    return 0
+
+def record_deltas(conn, tasks):
+    """Append the balance changes of tasks to the ledger, inside the caller's transaction"""
+    rows = [{"bankId": task_data["bankId"], "taskId": task_data["id"], "amount": task_delta(task_data)}
+            for task_data in tasks]
+    rows = [row for row in rows if row["amount"]]
+    if rows:
+        conn.execute(INSERT_DELTA, rows)
+    return len(rows)
+
+def compact(batch_size=10000):
+    """Fold up to batch_size ledger rows into Bank.balance and delete them, returning how many
+
+    The oldest ids are read without locking, then locked one by one by primary key, so no
+    gap is locked and tasks can keep appending deltas while this runs. A row another
+    compactor folded in the meantime is gone by the time its lock is granted, so every
+    delta is folded exactly once.
+    """
+    with engine.begin() as conn:
+        ids = conn.execute(text("SELECT id FROM BankBalanceDelta ORDER BY id LIMIT :limit"),
+                           {"limit": batch_size}).scalars().all()
+        if not ids:
+            return 0
+        rows = conn.execute(select(LEDGER.c.id, LEDGER.c.bankId, LEDGER.c.amount)
+                            .where(LEDGER.c.id.in_(ids)).with_for_update()).fetchall()
+        if not rows:
+            return 0
+
+        totals = {}
+        for row in rows:
+            totals[row.bankId] = totals.get(row.bankId, 0) + row.amount
+        # Banks in id order, like create_tasks, so concurrent lockers cannot deadlock on them
+        conn.execute(text("UPDATE Bank SET balance = balance + :amount WHERE id = :bank_id"),
+                     [{"bank_id": bank_id, "amount": totals[bank_id]} for bank_id in sorted(totals)])
+        delete = text("DELETE FROM BankBalanceDelta WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+        conn.execute(delete, {"ids": [row.id for row in rows]})
+    logger.info(f"Compacted {len(rows)} balance deltas into {len(totals)} banks")
+    return len(rows)
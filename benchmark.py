@@ -0,0 +1,218 @@
+"""Benchmark the report renderers on synthetic data.
+
+    python benchmark.py --banks 40 --tasks 500 --repeat 3 > bench.json
+
+Each run happens in a fresh process so peak RSS belongs to that renderer alone.
+create_excel_report (the DB path) reads from a SQLite stand-in of the Bank/Task/
+Branch/WithdrawBank schema, filled with the same synthetic data as the payload,
+through aiosqlite for its async queries. get_branches uses RIGHT JOIN, which needs
+SQLite 3.39 or newer.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+BENCH_DAY = datetime(2025, 2, 11)
+DATE_RANGE = ("2025-02-11 00:00:00", "2025-02-11 23:59:59")
+RENDERERS = ["report", "report2", "report2_write_only", "report2_sharded", "report2_parallel", "report3"]
+# Banks per sheet of the report2_sharded and report2_parallel renderers
+SHARD_BANKS = 10
+
+
+def make_reportdata(banks, tasks_per_bank, branch_codes=None, seed=0):
+    """Synthetic /generate-excel payload with banks x tasks_per_bank tasks"""
+    from config import color_code_mapping
+
+    rng = random.Random(seed)
+    codes = list(branch_codes or color_code_mapping)
+    result = []
+    for bank in range(banks):
+        tasks = []
+        for number in range(tasks_per_bank):
+            task_type = rng.choice(["WITHDRAW", "DEPOSIT"])
+            updated_at = BENCH_DAY + timedelta(seconds=rng.randrange(86400))
+            task = {
+                "id": f"b{bank}t{number}",
+                "date": updated_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "type": task_type,
+                "amount": rng.randint(1, 100000),
+                "name": f"Customer {rng.randint(1, 5000)}",
+                "status": rng.choice(["COMPLETE", "COMPLETE", "COMPLETE", "PENDING"]),
+                "branchs": {"code": rng.choice(codes)},
+                "users": {"name": f"admin{rng.randint(1, 20)}"},
+            }
+            if task_type == "WITHDRAW":
+                task["bank2"] = {"name": None}
+                task["WithdrawBank"] = {"bankAccountName": f"Account {rng.randint(1, 5000)}"}
+            tasks.append(task)
+        result.append({
+            "id": bank + 1,
+            "name": f"BANK {bank + 1:03d}",
+            "accountNo": str(1000000000 + bank),
+            "totalAmount": rng.randint(0, 1000000),
+            "tasks": tasks,
+        })
+    branch = [{"code": code, "amount": rng.randint(-100000, 100000)} for code in codes]
+    total = {"pendingTotal": 0, "completeTotal": 0, "grandTotal": 0}
+    return {"result": result, "branch": branch, "total": total}
+
+def make_sqlite_db(reportdata, path):
+    """Fill a SQLite file with the schema create_excel_report reads, from a reportdata payload"""
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        # NOCASE, like the MySQL collation the queries are written against
+        conn.execute(text("CREATE TABLE Bank (id INTEGER PRIMARY KEY, name TEXT, accountHolder TEXT, accountNo TEXT, balance NUMERIC DEFAULT 0)"))
+        conn.execute(text("CREATE TABLE Branch (id INTEGER PRIMARY KEY, code TEXT)"))
+        conn.execute(text("""
+            CREATE TABLE Task (
+                id TEXT PRIMARY KEY, bankId INTEGER, branchId INTEGER, amount NUMERIC,
+                type TEXT COLLATE NOCASE, name TEXT, status TEXT COLLATE NOCASE, reason TEXT,
+                isDelete BOOLEAN DEFAULT 0, updatedAt TIMESTAMP
+            )
+        """))
+        conn.execute(text("CREATE TABLE WithdrawBank (id INTEGER PRIMARY KEY, taskId TEXT, bankAccountName TEXT)"))
+        conn.execute(text("CREATE INDEX Task_bankId_updatedAt_idx ON Task (bankId, updatedAt)"))
+
+        branch_ids = {branch["code"]: idx for idx, branch in enumerate(reportdata["branch"], start=1)}
+        conn.execute(text("INSERT INTO Branch (id, code) VALUES (:id, :code)"),
+                     [{"id": idx, "code": code} for code, idx in branch_ids.items()])
+        conn.execute(text("INSERT INTO Bank (id, name, accountHolder, accountNo) VALUES (:id, :name, :name, :accountNo)"),
+                     [{"id": a["id"], "name": a["name"], "accountNo": a["accountNo"]} for a in reportdata["result"]])
+
+        tasks = []
+        withdraw_banks = []
+        for account in reportdata["result"]:
+            for task in account["tasks"]:
+                tasks.append({
+                    "id": task["id"],
+                    "bankId": account["id"],
+                    "branchId": branch_ids.get(task["branchs"]["code"]),
+                    "amount": task["amount"],
+                    "type": task["type"],
+                    "name": task["name"],
+                    "status": task["status"],
+                    "updatedAt": datetime.strptime(task["date"], "%Y-%m-%dT%H:%M:%S.000Z"),
+                })
+                if task["type"] == "WITHDRAW":
+                    withdraw_banks.append({"taskId": task["id"], "name": task["WithdrawBank"]["bankAccountName"]})
+        conn.execute(text("""
+            INSERT INTO Task (id, bankId, branchId, amount, type, name, status, reason, updatedAt)
+            VALUES (:id, :bankId, :branchId, :amount, :type, :name, :status, '', :updatedAt)
+        """), tasks)
+        if withdraw_banks:
+            conn.execute(text("INSERT INTO WithdrawBank (taskId, bankAccountName) VALUES (:taskId, :name)"), withdraw_banks)
+    engine.dispose()
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _render(renderer, reportdata, db_path, report_id):
+    """Run one renderer and return the generated filename"""
+    if renderer == "report":
+        import data_service, async_data_service
+        from excel_service import create_excel_report
+        data_service.engine = create_engine(
+            f"sqlite:///{db_path}", connect_args={"detect_types": sqlite3.PARSE_DECLTYPES})
+        async_data_service.ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{db_path}"
+        return create_excel_report(report_id, DATE_RANGE)
+    if renderer == "report2":
+        from excel_service2 import create_excel_report2
+        return create_excel_report2(report_id, DATE_RANGE, reportdata=reportdata)
+    if renderer == "report2_write_only":
+        from excel_service2 import create_excel_report2
+        return create_excel_report2(report_id, DATE_RANGE, reportdata=reportdata, write_only=True)
+    if renderer == "report2_sharded":
+        from excel_service2 import create_excel_report2
+        return create_excel_report2(report_id, DATE_RANGE, reportdata=reportdata, banks_per_sheet=SHARD_BANKS)
+    if renderer == "report2_parallel":
+        from excel_service2 import create_excel_report2
+        return create_excel_report2(report_id, DATE_RANGE, reportdata=reportdata, banks_per_sheet=SHARD_BANKS,
+                                    sheet_workers=os.cpu_count() or 1)
+    if renderer == "report3":
+        from excel_service3 import create_excel_report3
+        return create_excel_report3(report_id, DATE_RANGE, reportdata=reportdata)
+    raise ValueError(f"Unknown renderer {renderer}")
+
+def _worker(renderer, banks, tasks_per_bank, seed, branch_codes, db_path, queue):
+    """Child process: build the payload, render once and report timings"""
+    import logging
+    logging.disable(logging.INFO)
+    from config import REPORTS_DIR
+    import excel_service, excel_service2, excel_service3  # imports are not part of the timing
+
+    reportdata = make_reportdata(banks, tasks_per_bank, branch_codes, seed)
+    rows = banks * tasks_per_bank
+    baseline_rss = _peak_rss_mb()
+
+    report_id = f"bench_{renderer}_{os.getpid()}"
+    start = time.perf_counter()
+    filename = _render(renderer, reportdata, db_path, report_id)
+    seconds = time.perf_counter() - start
+
+    filepath = os.path.join(REPORTS_DIR, filename)
+    size = os.path.getsize(filepath)
+    os.remove(filepath)
+    queue.put({
+        "renderer": renderer,
+        "banks": banks,
+        "tasks_per_bank": tasks_per_bank,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "output_bytes": size,
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    })
+
+def run_benchmark(banks, tasks_per_bank, renderers=RENDERERS, repeat=1, seed=0, branch_codes=None):
+    """Time each renderer end to end, including wb.save, and return one result dict per run"""
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = None
+        if "report" in renderers:
+            db_path = os.path.join(tmp, "bench.sqlite3")
+            make_sqlite_db(make_reportdata(banks, tasks_per_bank, branch_codes, seed), db_path)
+        for renderer in renderers:
+            for _ in range(repeat):
+                queue = context.Queue()
+                process = context.Process(target=_worker,
+                                          args=(renderer, banks, tasks_per_bank, seed, branch_codes, db_path, queue))
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    results.append({"renderer": renderer, "error": f"exit code {process.exitcode}"})
+                    continue
+                results.append(queue.get())
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--banks", type=int, default=10)
+    parser.add_argument("--tasks", type=int, default=200, help="tasks per bank")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--branch-codes", type=lambda value: value.split(","),
+                        help="comma separated branch codes to draw from (default: the codes in color_code_mapping)")
+    parser.add_argument("--renderer", action="append", choices=RENDERERS,
+                        help="renderer to run, may be repeated (default: all)")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.banks, args.tasks, args.renderer or RENDERERS, args.repeat, args.seed,
+                            args.branch_codes)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
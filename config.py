@@ -11,6 +11,7 @@ logger = logging.getLogger(__name__)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 REPORTS_DIR = os.path.join(SCRIPT_DIR, "reports")
 os.makedirs(REPORTS_DIR, mode=0o777, exist_ok=True)
+JOBS_DB = os.path.join(SCRIPT_DIR, "report_jobs.sqlite3")
 
 
 # Database credentials production
@@ -32,10 +33,61 @@ database = "calculatorProduction"
 # Database
 DATABASE_URL = f"mysql://{username}:{password}@{host}:{port}/{database}"
 engine = create_engine(DATABASE_URL, pool_size=5, max_overflow=10)
+# Same database through an asyncio driver, for async_data_service
+ASYNC_DATABASE_URL = os.environ.get(
+    "ASYNC_DATABASE_URL", f"mysql+aiomysql://{username}:{password}@{host}:{port}/{database}")
 
 # Timezone
 malaysia_tz = pytz.timezone('Asia/Kuala_Lumpur')
 
+# Report workers: processes rendering reports, and how many more may wait for a free one
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", os.cpu_count() or 1))
+REPORT_QUEUE_LIMIT = int(os.environ.get("REPORT_QUEUE_LIMIT", 10))
+# Sheets of a multi-sheet report (banks_per_sheet) rendered at once by one report, each in
+# its own process; 1 renders them one after another in the report worker
+REPORT_SHEET_WORKERS = int(os.environ.get("REPORT_SHEET_WORKERS", 1))
+
+# Report cache: generated files kept for identical requests, least recently used evicted first
+REPORT_CACHE_MAX_BYTES = int(os.environ.get("REPORT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+REPORT_CACHE_MAX_FILES = int(os.environ.get("REPORT_CACHE_MAX_FILES", 500))
+# Queued or running jobs older than this are presumed dead: failed and no longer reused
+REPORT_JOB_TIMEOUT = int(os.environ.get("REPORT_JOB_TIMEOUT", 3600))
+# Report retention: every REPORT_SWEEP_INTERVAL seconds, reports not downloaded for
+# REPORT_MAX_AGE_SECONDS are deleted and the cache limits above are enforced
+REPORT_MAX_AGE_SECONDS = int(os.environ.get("REPORT_MAX_AGE_SECONDS", 7 * 24 * 3600))
+REPORT_SWEEP_INTERVAL = float(os.environ.get("REPORT_SWEEP_INTERVAL", 300))
+
+# Report downloads: served by the app, or handed to the fronting web server with
+# "x-accel-redirect" (nginx, REPORTS_DIR behind an internal location at REPORT_ACCEL_PREFIX)
+# or "x-sendfile" (Apache mod_xsendfile, lighttpd)
+REPORT_SENDFILE = os.environ.get("REPORT_SENDFILE", "").lower()
+REPORT_ACCEL_PREFIX = os.environ.get("REPORT_ACCEL_PREFIX", "/internal/reports/")
+
+# Streamed downloads: payloads up to STREAM_MAX_ROWS tasks are rendered in memory and
+# returned in the response; larger ones go through the job queue
+STREAM_MAX_ROWS = int(os.environ.get("STREAM_MAX_ROWS", 5000))
+
+# Uploaded reportdata bodies (POST /generate-excel/upload), kept on disk until their report is rendered
+UPLOAD_DIR = os.path.join(SCRIPT_DIR, "uploads")
+# Largest report request body, counted after gzip/zstd decompression
+REPORT_BODY_MAX_BYTES = int(os.environ.get("REPORT_BODY_MAX_BYTES", 512 * 1024 ** 2))
+
+# Incremental DB reports: fetched transactions kept per date range, refreshed with tasks
+# updated since the newest one seen, minus an overlap for rows committed late
+SNAPSHOT_DIR = os.path.join(SCRIPT_DIR, "report_snapshots")
+SNAPSHOT_OVERLAP_SECONDS = int(os.environ.get("SNAPSHOT_OVERLAP_SECONDS", 60))
+# Hard deleted tasks never show up as changed, so a snapshot is rebuilt from a full query
+# once it is this old; the report sweep removes snapshots not refreshed for as long
+SNAPSHOT_REBUILD_SECONDS = int(os.environ.get("SNAPSHOT_REBUILD_SECONDS", 3600))
+
+# Largest batch accepted by POST /tasks/batch
+TASK_BATCH_LIMIT = int(os.environ.get("TASK_BATCH_LIMIT", 5000))
+
+# Balance ledger compaction: every BALANCE_COMPACT_INTERVAL seconds, fold up to
+# BALANCE_COMPACT_BATCH deltas at a time into Bank.balance
+BALANCE_COMPACT_INTERVAL = float(os.environ.get("BALANCE_COMPACT_INTERVAL", 5))
+BALANCE_COMPACT_BATCH = int(os.environ.get("BALANCE_COMPACT_BATCH", 10000))
+
 # Report settings
 #QUERY_DATE_RANGE = ('2025-02-11 00:00:00', '2025-02-11 23:59:59')
 color_code_mapping = {
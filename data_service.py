@@ -1,26 +1,16 @@
+from itertools import groupby
+from operator import attrgetter
 from sqlalchemy import text
 from config import engine, logger
 
-def get_accounts():
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
+# Queries shared with async_data_service
+ACCOUNTS_QUERY = """
                 SELECT id, name, accountHolder, accountNo 
                 FROM Bank
                 ORDER BY name
-            """))
-            accounts = result.fetchall()
-            logger.info(f"Retrieved {len(accounts)} accounts")
-            return accounts
-    except Exception as e:
-        logger.error(f"Error retrieving accounts: {str(e)}")
-        raise
+            """
 
-def get_banks(date_range):
-    try:
-        with engine.connect() as conn:
-            start_date, end_date = date_range
-            result = conn.execute(text("""
+BANKS_QUERY = """
                SELECT 
                     IFNULL(SUM(a.amount), 0) AS total,
                     b.name,
@@ -35,7 +25,58 @@ def get_banks(date_range):
                     a.updatedAt BETWEEN :start_date AND :end_date
                 GROUP BY 
                     b.id;
-            """), {"start_date": start_date, "end_date": end_date})
+            """
+
+BRANCHES_QUERY = """
+               SELECT 
+                    SUM(CASE WHEN type = 'deposit' THEN amount WHEN type = 'withdraw' THEN -amount ELSE 0 END) AS total,
+                    b.code 
+                FROM 
+                    Task AS a 
+                RIGHT JOIN 
+                    Branch AS b 
+                ON 
+                    a.branchId = b.id 
+                AND a.updatedAt BETWEEN :start_date AND :end_date
+                GROUP BY 
+                b.id;
+            """
+
+# Pending, complete and grand totals from one scan.
+# Pending counts every PENDING/ADMIN_PENDING task regardless of date, the other two
+# only the date range. The WHERE is two ranges of the (status, updatedAt) index,
+# see migrations/001_task_status_updatedAt_index.sql
+TOTALS_QUERY = """
+                SELECT
+                    COALESCE(SUM(CASE WHEN status IN ('PENDING', 'ADMIN_PENDING') THEN amount ELSE 0 END), 0) as pending_total,
+                    COALESCE(SUM(CASE WHEN status = 'COMPLETE' AND updatedAt BETWEEN :start_date AND :end_date THEN
+                        CASE WHEN type = 'deposit' THEN amount 
+                             WHEN type = 'withdraw' THEN -amount 
+                             ELSE 0 
+                        END
+                    ELSE 0 END), 0) as complete_total,
+                    COALESCE(SUM(CASE WHEN status IN ('PENDING', 'COMPLETE') AND updatedAt BETWEEN :start_date AND :end_date THEN amount ELSE 0 END), 0) as grand_total
+                FROM Task
+                WHERE status IN ('PENDING', 'ADMIN_PENDING')
+                OR (status = 'COMPLETE' AND updatedAt BETWEEN :start_date AND :end_date)
+            """
+
+def get_accounts():
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(text(ACCOUNTS_QUERY))
+            accounts = result.fetchall()
+            logger.info(f"Retrieved {len(accounts)} accounts")
+            return accounts
+    except Exception as e:
+        logger.error(f"Error retrieving accounts: {str(e)}")
+        raise
+
+def get_banks(date_range):
+    try:
+        with engine.connect() as conn:
+            start_date, end_date = date_range
+            result = conn.execute(text(BANKS_QUERY), {"start_date": start_date, "end_date": end_date})
             accounts = result.fetchall()
             logger.info(f"Retrieved {len(accounts)} accounts")
             return accounts
@@ -98,20 +139,7 @@ def get_branches(date_range):
     try:
         with engine.connect() as conn:
             start_date, end_date = date_range
-            result = conn.execute(text("""
-               SELECT 
-                    SUM(CASE WHEN type = 'deposit' THEN amount WHEN type = 'withdraw' THEN -amount ELSE 0 END) AS total,
-                    b.code 
-                FROM 
-                    Task AS a 
-                RIGHT JOIN 
-                    Branch AS b 
-                ON 
-                    a.branchId = b.id 
-                AND a.updatedAt BETWEEN :start_date AND :end_date
-                GROUP BY 
-                b.id;
-            """), {"start_date": start_date, "end_date": end_date})
+            result = conn.execute(text(BRANCHES_QUERY), {"start_date": start_date, "end_date": end_date})
             branches = result.fetchall()
             logger.info(f"Retrieved {len(branches)} branches for date range {date_range}")
             return branches
@@ -122,120 +150,163 @@ def get_total(date_range):
     try:
         with engine.connect() as conn:
             start_date, end_date = date_range
-            
-            # Query for pending total
-            pending_result = conn.execute(text("""
-                SELECT COALESCE(SUM(amount), 0) as pending_total
-                FROM Task
-                WHERE status IN ('PENDING', 'ADMIN_PENDING')
-                OR (status IN ('PENDING', 'ADMIN_PENDING') AND updatedAt BETWEEN :start_date AND :end_date)
-                
-            """), {"start_date": start_date, "end_date": end_date})
-            pending_total = pending_result.scalar() or 0
-            
-            # Query for complete total (with type adjustment)
-            complete_result = conn.execute(text("""
-                SELECT COALESCE(SUM(
-                    CASE WHEN type = 'deposit' THEN amount 
-                         WHEN type = 'withdraw' THEN -amount 
-                         ELSE 0 
-                    END), 0) as complete_total
-                FROM Task
-                WHERE status = 'COMPLETE'
-                AND updatedAt BETWEEN :start_date AND :end_date
-            """), {"start_date": start_date, "end_date": end_date})
-            complete_total = complete_result.scalar() or 0
-            
-            # Query for grand total
-            grand_result = conn.execute(text("""
-                SELECT COALESCE(SUM(amount), 0) as grand_total
-                FROM Task
-                WHERE status IN ('PENDING', 'COMPLETE')
-                AND updatedAt BETWEEN :start_date AND :end_date
-            """), {"start_date": start_date, "end_date": end_date})
-            grand_total = grand_result.scalar() or 0
-            
-            return {
-                "pending_total": pending_total,
-                "complete_total": complete_total, 
-                "grand_total": grand_total
-            }
+            result = conn.execute(text(TOTALS_QUERY), {"start_date": start_date, "end_date": end_date})
+            return totals_dict(result.one())
     except Exception as e:
         logger.error(f"Error retrieving task totals: {str(e)}")
         raise
 
-def get_transactions2(bank_id, date_range=None):
+def totals_dict(totals):
+    return {
+        "pending_total": totals.pending_total or 0,
+        "complete_total": totals.complete_total or 0, 
+        "grand_total": totals.grand_total or 0
+    }
+
+def transactions2_statements(bank_id, date_range=None, batch_size=1000):
+    """(first page, next page, params) for paging a bank's transactions newest first"""
+    query = """
+        SELECT t.id, t.amount, t.type, t.name, t.status, t.updatedAt, t.reason, b.code,c.bankAccountName
+        FROM Task AS t
+        LEFT JOIN Branch AS b ON t.branchId = b.id
+        LEFT JOIN WithdrawBank AS c ON t.id = c.taskId
+        WHERE t.bankId =  :bank_id
+    """
+
+    # Add date filter if provided
+    params = {"bank_id": bank_id, "limit": batch_size}
+    if date_range:
+        start_date, end_date = date_range
+        query += " AND (t.updatedAt BETWEEN :start_date AND :end_date or t.status IN ('PENDING', 'ADMIN_PENDING')  )"
+        params["start_date"] = start_date
+        params["end_date"] = end_date
+
+    # Later pages continue after the last row of the previous page (:last_updated, :last_id)
+    # instead of using OFFSET
+    order = " ORDER BY t.updatedAt DESC, t.id DESC LIMIT :limit"
+    seek = " AND (t.updatedAt < :last_updated OR (t.updatedAt = :last_updated AND t.id < :last_id))"
+    return text(query + order), text(query + seek + order), params
+
+def iter_transactions2(bank_id, date_range=None, batch_size=1000):
+    """Yield a bank's transactions in batches, newest first, seeking on (updatedAt, id)"""
+    try:
+        with engine.connect() as conn:
+            total = 0
+            statement, next_statement, params = transactions2_statements(bank_id, date_range, batch_size)
+
+            while True:
+                batch = conn.execute(statement, params).fetchall()
+                if not batch:
+                    break
+
+                total += len(batch)
+                yield batch
+
+                if len(batch) < batch_size:
+                    break
+
+                last = batch[-1]
+                params["last_updated"] = last.updatedAt
+                params["last_id"] = last.id
+                statement = next_statement
+
+            logger.info(f"Retrieved {total} transactions for bank_id {bank_id}")
+    except Exception as e:
+        logger.error(f"Error retrieving transactions for bank_id {bank_id}: {str(e)}")
+        raise
+
+def iter_transactions_by_bank(date_range=None, batch_size=1000):
+    """Yield (bankId, transactions) for every bank from one query streamed on a server-side cursor"""
     try:
         with engine.connect() as conn:
-            BATCH_SIZE = 1000
-            all_transactions = []
-            offset = 0
-            
-            # Base query
             query = """
-                SELECT t.amount, t.type, t.name, t.status, t.updatedAt, t.reason, b.code,c.bankAccountName
+                SELECT t.id, t.bankId, t.amount, t.type, t.name, t.status, t.updatedAt, t.reason, b.code,c.bankAccountName
                 FROM Task AS t
                 LEFT JOIN Branch AS b ON t.branchId = b.id
                 LEFT JOIN WithdrawBank AS c ON t.id = c.taskId
-                WHERE t.bankId =  :bank_id
             """
-        
-            
+
+            query += " WHERE t.isDelete = false"
+
             # Add date filter if provided
-            params = {"bank_id": bank_id}
+            params = {}
             if date_range:
                 start_date, end_date = date_range
                 query += " AND (t.updatedAt BETWEEN :start_date AND :end_date or t.status IN ('PENDING', 'ADMIN_PENDING')  )"
                 params["start_date"] = start_date
                 params["end_date"] = end_date
-                
-            query += " ORDER BY t.updatedAt DESC LIMIT :limit OFFSET :offset"
-            
-            while True:
-                params["limit"] = BATCH_SIZE
-                params["offset"] = offset
-                
-                result = conn.execute(text(query), params)
-                
-                batch = result.fetchall()
-                if not batch:
-                    break
-                    
-                all_transactions.extend(batch)
-                offset += BATCH_SIZE
-                
-                if len(batch) < BATCH_SIZE:
-                    break
-            
-            logger.info(f"Retrieved {len(all_transactions)} transactions for bank_id {bank_id}")
-            return all_transactions
+
+            query += " ORDER BY t.bankId, t.updatedAt DESC, t.id DESC"
+
+            result = conn.execution_options(stream_results=True).execute(text(query), params)
+            result.yield_per(batch_size)
+            # Each group must be consumed before moving on to the next one
+            banks = 0
+            for bank_id, transactions in groupby(result, key=attrgetter("bankId")):
+                banks += 1
+                yield bank_id, transactions
+
+            logger.info(f"Retrieved transactions for {banks} banks for date range {date_range}")
     except Exception as e:
-        logger.error(f"Error retrieving transactions for bank_id {bank_id}: {str(e)}")
+        logger.error(f"Error retrieving transactions for date range {date_range}: {str(e)}")
         raise
 
+def get_transactions2(bank_id, date_range=None):
+    all_transactions = []
+    for batch in iter_transactions2(bank_id, date_range):
+        all_transactions.extend(batch)
+    return all_transactions
+
 def create_task(task_data):
     from sqlalchemy import text
+    from balance_ledger import record_deltas
+    from task_service import validate_task
 
+    # 字段、类型和金额与批量接口使用同一校验
+    validate_task(task_data)
     with engine.begin() as conn:  # 开启事务
-        bank_id = task_data["bankId"]
-        amount = task_data["amount"]
-        task_type = task_data["type"]
-
-        if task_type == "WITHDRAW":
-            # ✅ 允许负数，直接扣款
-            conn.execute(
-                text("UPDATE Bank SET balance = balance - :amount WHERE id = :bank_id"),
-                {"amount": amount, "bank_id": bank_id}
-            )
-        elif task_type == "DEPOSIT":
-            # 加钱
-            conn.execute(
-                text("UPDATE Bank SET balance = balance + :amount WHERE id = :bank_id"),
-                {"amount": amount, "bank_id": bank_id}
-            )
+        # 余额变动写入账本, 由 balance_ledger.compact 合并到 Bank.balance
+        record_deltas(conn, [task_data])
 
         # 插入任务记录
         conn.execute(text("""
             INSERT INTO Task (id, bankId, amount, type, status, updatedAt)
             VALUES (:id, :bankId, :amount, :type, :status, NOW())
-        """), task_data)
\ No newline at end of file
+        """), task_data)
+
+def iter_changed_transactions(date_range, since=None, batch_size=1000):
+    """Yield transactions for an incremental report, oldest update first
+
+    Without since these are the rows iter_transactions_by_bank would return. With since
+    they are every task updated at or after it, including deleted tasks and ones that
+    no longer match the date range, so the caller can drop them.
+    """
+    try:
+        with engine.connect() as conn:
+            query = """
+                SELECT t.id, t.bankId, t.amount, t.type, t.name, t.status, t.updatedAt, t.reason, b.code,c.bankAccountName,
+                       t.isDelete
+                FROM Task AS t
+                LEFT JOIN Branch AS b ON t.branchId = b.id
+                LEFT JOIN WithdrawBank AS c ON t.id = c.taskId
+            """
+            if since is None:
+                start_date, end_date = date_range
+                query += " WHERE t.isDelete = false AND (t.updatedAt BETWEEN :start_date AND :end_date or t.status IN ('PENDING', 'ADMIN_PENDING')  )"
+                params = {"start_date": start_date, "end_date": end_date}
+            else:
+                query += " WHERE t.updatedAt >= :since"
+                params = {"since": since}
+            query += " ORDER BY t.updatedAt, t.id"
+
+            result = conn.execution_options(stream_results=True).execute(text(query), params)
+            result.yield_per(batch_size)
+            total = 0
+            for row in result:
+                total += 1
+                yield row
+
+            logger.info(f"Retrieved {total} changed transactions since {since} for date range {date_range}")
+    except Exception as e:
+        logger.error(f"Error retrieving changed transactions for date range {date_range}: {str(e)}")
+        raise
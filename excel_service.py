@@ -1,3 +1,4 @@
+import logging
 import os
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Border, Side, Alignment, Font,Color
@@ -8,9 +9,12 @@ import pytz
 from datetime import datetime
 
 from config import logger, REPORTS_DIR, malaysia_tz,color_code_mapping
-from data_service import get_accounts, get_banks, get_transactions,get_transactions2, get_branches,get_total
+from task_dates import convert_task_dates
+from data_service import get_accounts, get_banks, get_transactions,get_transactions2,iter_transactions_by_bank, get_branches,get_total
+from report_snapshot import refresh_snapshot
+from async_data_service import load_report_inputs
 
-def create_excel_report(report_id: str,date_range=None):
+def create_excel_report(report_id: str,date_range=None,incremental:bool=False):
     try:
         if not date_range:
             today = datetime.now().strftime('%Y-%m-%d')
@@ -29,8 +33,8 @@ def create_excel_report(report_id: str,date_range=None):
             bottom=Side(style='thin')
         )
         
-        # Get accounts
-        accounts = get_accounts()
+        # Get accounts, with the totals and branches for the summary, from concurrent queries
+        accounts, totals, branches = load_report_inputs(date_range)
         if not accounts:
             raise ValueError("No accounts found")
         
@@ -84,15 +88,9 @@ def create_excel_report(report_id: str,date_range=None):
         current_col = 3
         #   ROW FOR BANK LIST
         row_bank = 4
+        bank_columns = {}
         for account in accounts:
             try:
-                # Add START
-                # cell = ws.cell(row=4, column=current_col, value="START")
-                cell.border = thin_border
-               
-                # Get and process transactions for this account
-                # transactions = get_transactions(account.id,date_range)
-                transactions = get_transactions2(account.id,date_range)
                  # ADD BANK 
                 color_bank = "FFC080"
                 color_value_bank ="FFC0C0"
@@ -107,91 +105,44 @@ def create_excel_report(report_id: str,date_range=None):
                 ws.cell(row=row_bank, column=2,).fill = PatternFill(start_color=color_value_bank, end_color=color_value_bank, fill_type="solid")
                 ws.cell(row=row_bank, column=2,).border  = thin_border
                 row_bank += 1
-                # logger.info(f"row bank name{name_Bank}: {value_total_Bank}")
-                # logger.info(f"row {row_bank}: {row_bank}")
-                if not transactions:
-                    logger.info(f"list tast for bank ${account.id}: {transactions}")
-                else:
-                    total_rowFormula = 0
-                    for idx, trans in enumerate(transactions, start=4):
-                        try:
-                            # Handle potential None or invalid datetime values
-                            
-                            created_at = getattr(trans, 'updatedAt', None)
-                            logger.info(f"updatedAt: {created_at}")
-                            typeTask = getattr(trans, 'type', '')
-                            logger.info(f"row {typeTask}: {typeTask}")
-                            code = getattr(trans, 'code', '')
-                            if code is not None:
-                                logger.info(f"ada color: {code}")
-                                color_Branch = get_color_by_code(code)
-                            else:
-                                color_Branch = 'FFFFFF'
-                            if created_at:
-                                if created_at.tzinfo is None:
-                                    created_at = pytz.utc.localize(created_at)
-
-                                malaysia_time = created_at.astimezone(malaysia_tz)    
-                                date_str = malaysia_time.strftime('%d-%m-%Y')
-                                time_str = malaysia_time.strftime('%H:%M:%S')
-                            else:
-                                date_str = ''
-                                time_str = ''
-                                
-                            ws.cell(row=idx, column=current_col).value = date_str
-                            ws.cell(row=idx, column=current_col + 1).value = getattr(trans, 'code', '')
-                            
-                            if typeTask == "WITHDRAW":
-                                status_value = getattr(trans, 'bankAccountName', None)
-                                ws.cell(row=idx, column=current_col + 2).value = status_value if status_value else ""
-                            else:
-                                status_value = getattr(trans, 'name', None)
-                                ws.cell(row=idx, column=current_col + 2).value = status_value if status_value else ""
-                                ws.cell(row=idx, column=current_col + 2).alignment = Alignment(wrap_text=True)
-                                
-                            
-                            ws.cell(row=idx, column=current_col + 1).border = thin_border
-                            if typeTask == "WITHDRAW":
-                                ws.cell(row=idx, column=current_col + 3).value = getattr(trans, 'amount', 0)
-                            else:
-                                ws.cell(row=idx, column=current_col + 4).value = getattr(trans, 'amount', '')
-                            
-                            ws.cell(row=idx, column=current_col + 2).border = thin_border
-                            ws.cell(row=idx, column=current_col + 3).border = thin_border
-                            ws.cell(row=idx, column=current_col + 4).border = thin_border
-                            ws.cell(row=idx, column=current_col + 5).border = thin_border
-                            ws.cell(row=idx, column=current_col ).border = thin_border
-                            ws.cell(row=idx, column=current_col + 5).value = time_str
-                            #color row
-                            ws.cell(row=idx, column=current_col).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            ws.cell(row=idx, column=current_col + 1).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            ws.cell(row=idx, column=current_col + 2).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            ws.cell(row=idx, column=current_col + 3).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            ws.cell(row=idx, column=current_col + 4).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            total_rowFormula = idx
-                        except Exception as e:
-                            logger.error(f"Error processing transaction: {str(e)}")
-                            continue
-                            
-                    # Add formulas and totals
-                    _add_bank_summary(ws, current_col, total_rowFormula)
-                    
-                   
-                    logger.info(f"row_bank: {value_total_Bank}")
+                bank_columns[account.id] = current_col
             except Exception as e:
                 logger.error(f"Error processing account {getattr(account, 'id', 'unknown')}: {str(e)}")
-                continue
                 
             current_col += 7
+
+        # Get and process transactions for every bank from one query, or in incremental
+        # mode from the stored snapshot after fetching only the tasks updated since the last run
+        if incremental:
+            transactions_by_bank = refresh_snapshot(date_range).iter_banks()
+        else:
+            transactions_by_bank = iter_transactions_by_bank(date_range)
+        banks_with_tasks = set()
+        for bank_id, transactions in transactions_by_bank:
+            bank_col = bank_columns.get(bank_id)
+            if bank_col is None:
+                continue
+            try:
+                banks_with_tasks.add(bank_id)
+                total_rowFormula = _add_transactions(ws, bank_col, transactions, thin_border)
+                # Add formulas and totals
+                _add_bank_summary(ws, bank_col, total_rowFormula)
+            except Exception as e:
+                logger.error(f"Error processing account {bank_id}: {str(e)}")
+                continue
+
+        for bank_id in bank_columns:
+            if bank_id not in banks_with_tasks:
+                logger.info(f"list tast for bank ${bank_id}: []")
         
         array_length = len(accounts)
         last_row_Bank = array_length
         logger.info(f"last_row_Bank: {last_row_Bank}")
         # Add bank summary section
-        _add_bank_list_summary(ws, last_row_Bank,date_range)
+        _add_bank_list_summary(ws, last_row_Bank,date_range,totals)
         
         # Add branch data
-        _add_branch_data(ws, last_row_Bank,date_range)
+        _add_branch_data(ws, last_row_Bank,date_range,branches)
         
         # Set column widths
         for col in range(1, current_col):
@@ -217,6 +168,67 @@ def create_excel_report(report_id: str,date_range=None):
         logger.error(f"Error generating report: {str(e)}")
         raise
 
+def _add_transactions(ws, current_col, transactions, thin_border):
+    """Write one bank's transactions from row 4 down and return the last row written"""
+    total_rowFormula = 0
+    debug = logger.isEnabledFor(logging.DEBUG)
+    # transactions may be a groupby group, which can only be read once
+    transactions = list(transactions)
+    dates, times = convert_task_dates([getattr(trans, 'updatedAt', None) for trans in transactions])
+    for idx, trans in enumerate(transactions, start=4):
+        try:
+            # Handle potential None or invalid datetime values
+
+            created_at = getattr(trans, 'updatedAt', None)
+            typeTask = getattr(trans, 'type', '')
+            code = getattr(trans, 'code', '')
+            if debug:
+                logger.debug(f"updatedAt: {created_at} row {typeTask} color: {code}")
+            if code is not None:
+                color_Branch = get_color_by_code(code)
+            else:
+                color_Branch = 'FFFFFF'
+            date_str = dates[idx - 4]
+            time_str = times[idx - 4]
+            if date_str is None:
+                raise ValueError(f"Invalid date {created_at}")
+
+            ws.cell(row=idx, column=current_col).value = date_str
+            ws.cell(row=idx, column=current_col + 1).value = getattr(trans, 'code', '')
+
+            if typeTask == "WITHDRAW":
+                status_value = getattr(trans, 'bankAccountName', None)
+                ws.cell(row=idx, column=current_col + 2).value = status_value if status_value else ""
+            else:
+                status_value = getattr(trans, 'name', None)
+                ws.cell(row=idx, column=current_col + 2).value = status_value if status_value else ""
+                ws.cell(row=idx, column=current_col + 2).alignment = Alignment(wrap_text=True)
+
+
+            ws.cell(row=idx, column=current_col + 1).border = thin_border
+            if typeTask == "WITHDRAW":
+                ws.cell(row=idx, column=current_col + 3).value = getattr(trans, 'amount', 0)
+            else:
+                ws.cell(row=idx, column=current_col + 4).value = getattr(trans, 'amount', '')
+
+            ws.cell(row=idx, column=current_col + 2).border = thin_border
+            ws.cell(row=idx, column=current_col + 3).border = thin_border
+            ws.cell(row=idx, column=current_col + 4).border = thin_border
+            ws.cell(row=idx, column=current_col + 5).border = thin_border
+            ws.cell(row=idx, column=current_col ).border = thin_border
+            ws.cell(row=idx, column=current_col + 5).value = time_str
+            #color row
+            ws.cell(row=idx, column=current_col).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
+            ws.cell(row=idx, column=current_col + 1).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
+            ws.cell(row=idx, column=current_col + 2).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
+            ws.cell(row=idx, column=current_col + 3).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
+            ws.cell(row=idx, column=current_col + 4).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
+            total_rowFormula = idx
+        except Exception as e:
+            logger.error(f"Error processing transaction: {str(e)}")
+            continue
+    return total_rowFormula
+
 def _add_bank_summary(ws, current_col, total_rowFormula):
     """Helper to add formulas and totals for each bank column"""
     #SUM FOR WITHDRAW
@@ -244,7 +256,7 @@ def _add_bank_summary(ws, current_col, total_rowFormula):
     formula_Total_All = f"=({cell_withdraw}{total_rowFormula+1} - {cell_deposit}{total_rowFormula+1}) * -1"
     ws.cell(row=1, column=current_col+1, value=formula_Total_All)
 
-def _add_bank_list_summary(ws, last_row_Bank,date_range):
+def _add_bank_list_summary(ws, last_row_Bank,date_range,totals):
     """Add summary sections for banks"""
     light_pink = "FFD9D9"
     thin_border = Border(
@@ -255,7 +267,6 @@ def _add_bank_list_summary(ws, last_row_Bank,date_range):
     )
     
     summary_row = 4 + last_row_Bank 
-    totals = get_total(date_range)
     ws.cell(row=summary_row, column=1, value="cash")
     #center cash C0C0FF
     ws.cell(row=summary_row, column=1,).alignment = Alignment(horizontal='center')
@@ -302,7 +313,7 @@ def _add_bank_list_summary(ws, last_row_Bank,date_range):
     ws.cell(row=summary_row + 7, column=1, ).border  = thin_border
     ws.cell(row=summary_row + 7, column=2, ).border  = thin_border
 
-def _add_branch_data(ws, last_row_Bank,date_range):
+def _add_branch_data(ws, last_row_Bank,date_range,branches):
     """Add branch data to the report"""
     light_pink = "FFD9D9"
     thin_border = Border(
@@ -312,7 +323,6 @@ def _add_branch_data(ws, last_row_Bank,date_range):
         bottom=Side(style='thin')
     )
     
-    branches = get_branches(date_range)
     if not branches:
         raise ValueError("No branches found")
 
@@ -1,16 +1,31 @@
+import io
+import logging
+import multiprocessing
 import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Border, Side, Alignment, Font,Color
 from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.cell.text import InlineFont
 from openpyxl.cell.rich_text import TextBlock, CellRichText
 import pytz
 from datetime import datetime
 
-from config import logger, REPORTS_DIR, malaysia_tz,color_code_mapping
+from config import logger, REPORTS_DIR, REPORT_SHEET_WORKERS, malaysia_tz,color_code_mapping
+from style_registry import StyleRegistry
+from report_metrics import ReportMetrics
+from report_columns import BankColumns, normalize_reportdata
 from data_service import get_accounts, get_banks, get_transactions,get_transactions2, get_branches,get_total
 
-def create_excel_report2(report_id: str,date_range=None,reportdata:dict=None):
+def create_excel_report2(report_id: str,date_range=None,reportdata:dict=None,write_only:bool=False,metrics:ReportMetrics=None,banks_per_sheet:int=None,sheet_workers:int=None):
+    # The sharded layout is only built by the write-only writer
+    if write_only or banks_per_sheet:
+        return create_excel_report2_write_only(report_id, date_range, reportdata, metrics, banks_per_sheet, sheet_workers)
+    if metrics is None:
+        metrics = ReportMetrics()
+    debug = logger.isEnabledFor(logging.DEBUG)
     try:
         if not date_range:
             today = datetime.now().strftime('%Y-%m-%d')
@@ -20,17 +35,10 @@ def create_excel_report2(report_id: str,date_range=None,reportdata:dict=None):
         ws = wb.active
         
         # Styles
-        light_blue = "FFB6D7E8"
-        light_pink = "FFFFD9D9"
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+        styles = StyleRegistry(wb)
         
-        # Get accounts
-        accounts = reportdata.get("result", []) if reportdata else []
+        # Get accounts, with their tasks as columns
+        accounts = normalize_reportdata(reportdata)
         branch_data = reportdata.get("branch", []) if reportdata else []
         totals = reportdata.get("total", {}) if reportdata else {
             "pendingTotal": 0,
@@ -39,56 +47,41 @@ def create_excel_report2(report_id: str,date_range=None,reportdata:dict=None):
         }
         if not accounts:
             raise ValueError("No accounts found")
+        metrics.lap("parse")
         
         # Create top row with zeros
         for col in range(1, len(accounts) * 8 + 3):
-            cell = ws.cell(row=1, column=col, value=0)
-            cell.fill = PatternFill(start_color=light_blue, end_color=light_blue, fill_type="solid")
-            cell.border = thin_border
+            ws.cell(row=1, column=col, value=0).style = styles.get("top_total")
         
         # Create headers with account information
-        ws.cell(row=2, column=1, value="进出账记录").fill = PatternFill(start_color=light_pink, end_color=light_pink, fill_type="solid")
-        ws.cell(row=2, column=2, ).fill = PatternFill(start_color=light_pink, end_color=light_pink, fill_type="solid")
-        cell = ws.cell(row=2, column=1)
-        cell.alignment = Alignment(horizontal='center')
+        ws.cell(row=2, column=1, value="进出账记录").style = styles.get("title")
         ws.merge_cells(start_row=2,start_column=1,end_row=2, end_column=2)
 
         current_col = 3
         for account in accounts:
            
             cell = ws.cell(row=2, column=current_col)
-            # Handle potential None values
-            # name = getattr(account, 'name', '') or ''
-            name = account.get("name", "") or ""
-            
-            # account_no = getattr(account, 'accountNo', '') or ''
-            account_no = account.get("accountNo", "") or ""
-            if isinstance(account_no, int):
-                account_no = str(account_no)
+            name = account.name
+            account_no = account.account_no
             red = InlineFont(color='FF0000')
             black  = InlineFont(color='000000')
             rich_string1 = CellRichText([TextBlock(black, name + ' '),  TextBlock(red, account_no)])
             # cell.value = f"{name} {account_no}".strip()
             cell.value = rich_string1
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-            # cell.fill = PatternFill(start_color=light_blue, end_color=light_blue, fill_type="solid")
-            cell.border = thin_border
+            cell.style = styles.get("bank_header")
             ws.merge_cells(start_row=2, start_column=current_col, end_row=2, end_column=current_col + 5)
             current_col += 8
         
-        ws.cell(row=3, column=1, value="底线").fill = PatternFill(start_color=light_blue, end_color=light_blue, fill_type="solid")
+        ws.cell(row=3, column=1, value="底线").style = styles.get("baseline")
         # Add column headers
         headers = ["Date", "Note", "Name","Withdraw", "deposit", "Time","Approve"]
         current_col = 3
         for _ in accounts:
             for header in headers:
-                cell = ws.cell(row=3, column=current_col, value=header)
-                cell.font = Font(bold=True)
-                cell.border = thin_border
-                # cell.fill = PatternFill(start_color=light_blue, end_color=light_blue, fill_type="solid")
+                ws.cell(row=3, column=current_col, value=header).style = styles.get("column_header")
                 current_col += 1
             current_col += 1
+        metrics.lap("layout")
         
         # Process transactions
         current_col = 3
@@ -96,137 +89,83 @@ def create_excel_report2(report_id: str,date_range=None,reportdata:dict=None):
         row_bank = 4
         for account in accounts:
             try:
-                # Add START
-                # cell = ws.cell(row=4, column=current_col, value="START")
-                cell.border = thin_border
-                bankAmount = account.get('totalAmount',0)
-                # Get and process transactions for this account
-                # transactions = get_transactions(account.id,date_range)
-                # transactions = get_transactions2(account.id,date_range)
-                tasks = account.get("tasks", [])
+                bankAmount = account.total_amount
                  # ADD BANK 
-                color_bank = "FFFFC080"
-                color_value_bank ="FFFFC0C0"
-                
                 name_Bank = get_column_letter(current_col)
                 
                 value_total_Bank = get_column_letter(current_col + 1)
-                ws.cell(row=row_bank, column=1, value=f"={name_Bank}2")
-                ws.cell(row=row_bank, column=1,).fill = PatternFill(start_color=color_bank, end_color=color_bank, fill_type="solid")
-                ws.cell(row=row_bank, column=1,).border  = thin_border
-                ws.cell(row=row_bank, column=2, value=bankAmount)
-                ws.cell(row=row_bank, column=2,).fill = PatternFill(start_color=color_value_bank, end_color=color_value_bank, fill_type="solid")
-                ws.cell(row=row_bank, column=2,).border  = thin_border
+                ws.cell(row=row_bank, column=1, value=f"={name_Bank}2").style = styles.get("bank_name")
+                ws.cell(row=row_bank, column=2, value=bankAmount).style = styles.get("bank_amount")
                 row_bank += 1
               
-                if not tasks:
-                    logger.info(f"list tast for bank ${account}: {tasks}")
+                if not len(account):
+                    logger.debug(f"no tasks for bank {account.name}")
                 else:
                     total_rowFormula = 0
-                    for idx, trans in enumerate(tasks, start=4):
+                    for position in range(len(account)):
+                        idx = position + 4
+                        date_str = account.dates[position]
+                        if date_str is None:
+                            # Unreadable task, already logged by normalize_reportdata
+                            continue
                         try:
-                            # Handle potential None or invalid datetime values
-                            
-                            # created_at = getattr(trans, 'updatedAt', None)
-                            created_at = trans.get('date')
-                            
-                            # typeTask = getattr(trans, 'type', '')
-                            typeTask = trans.get('type')
-                            
-                            # code = getattr(trans, 'code', '')
-                            branch_info = trans.get("branchs") or {}
-                            code = branch_info.get("code", "")
-                            if code is not None:
-                                color_Branch = get_color_by_code(code)
-                            else:
-                                color_Branch = 'FFFFFFFF'
-                            logger.info(f" color_Branch {color_Branch}")    
-                            if created_at:
-                                # if created_at.tzinfo is None:
-                                    # created_at = pytz.utc.localize(created_at)
-                                dt = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
-                                dt = dt.astimezone(malaysia_tz)
-                                date_str = dt.strftime('%d-%m-%Y')
-                                time_str = dt.strftime('%H:%M:%S')
-                                # malaysia_time = created_at.astimezone(malaysia_tz)    
-                                # date_str = malaysia_time.strftime('%d-%m-%Y')
-                                # time_str = malaysia_time.strftime('%H:%M:%S')
-                            else:
-                                date_str = ''
-                                time_str = ''
+                            code = account.codes[position]
+                            row_style = styles.branch(code)
+                            name_style = row_style
+                            if debug:
+                                logger.debug(f" row_style {row_style}")
                                 
                             ws.cell(row=idx, column=current_col).value = date_str
-                            # ws.cell(row=idx, column=current_col + 1).value = getattr(trans, 'code', '')
                             ws.cell(row=idx, column=current_col + 1).value = code
-                            
-                            if typeTask == "WITHDRAW":
-                                # status_value = getattr(trans, 'bankAccountName', None)
-                                adminbank = trans.get("bank2") or {}
-                                adminbankname = adminbank.get("name","")
-                                if adminbankname is not None:
-                                    status_value = adminbankname
-                                else:    
-                                    status_value =trans.get("WithdrawBank", {}).get("bankAccountName", "")
-                                ws.cell(row=idx, column=current_col + 2).value = status_value if status_value else ""
+                            ws.cell(row=idx, column=current_col + 2).value = account.label(position)
+                            if account.withdraw[position]:
+                                ws.cell(row=idx, column=current_col + 3).value = account.amounts[position]
                             else:
-                                # status_value = getattr(trans, 'name', None)
-                                status_value = trans.get('name','') or ""
-                                ws.cell(row=idx, column=current_col + 2).value = status_value if status_value else ""
-                                ws.cell(row=idx, column=current_col + 2).alignment = Alignment(wrap_text=True)
-                                
+                                ws.cell(row=idx, column=current_col + 4).value = account.amounts[position]
+                                name_style = styles.branch(code, wrap_text=True)
                             
-                            ws.cell(row=idx, column=current_col + 1).border = thin_border
-                            if typeTask == "WITHDRAW":
-                                # ws.cell(row=idx, column=current_col + 3).value = getattr(trans, 'amount', 0)
-                                ws.cell(row=idx, column=current_col + 3).value = trans.get('amount')
-                            else:
-                                # ws.cell(row=idx, column=current_col + 4).value = getattr(trans, 'amount', '') trans.get('amount')
-                                ws.cell(row=idx, column=current_col + 4).value = trans.get('amount')
-                            
-                            ws.cell(row=idx, column=current_col + 2).border = thin_border
-                            ws.cell(row=idx, column=current_col + 3).border = thin_border
-                            ws.cell(row=idx, column=current_col + 4).border = thin_border
-                            ws.cell(row=idx, column=current_col + 5).border = thin_border
-                            ws.cell(row=idx, column=current_col ).border = thin_border
-                            ws.cell(row=idx, column=current_col + 5).value = time_str
-                            adminName =trans.get('users',{}).get('name','')
-                            ws.cell(row=idx, column=current_col + 6).value = adminName
-                            ws.cell(row=idx, column=current_col + 6).border = thin_border
+                            ws.cell(row=idx, column=current_col + 5).value = account.times[position]
+                            ws.cell(row=idx, column=current_col + 6).value = account.admins[position]
                             #color row
-                            ws.cell(row=idx, column=current_col).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            ws.cell(row=idx, column=current_col + 1).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            ws.cell(row=idx, column=current_col + 2).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            ws.cell(row=idx, column=current_col + 3).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            ws.cell(row=idx, column=current_col + 4).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
-                            ws.cell(row=idx, column=current_col + 5).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")                            
-                            ws.cell(row=idx, column=current_col + 6).fill = PatternFill(start_color=color_Branch, end_color=color_Branch, fill_type="solid")
+                            for offset in range(7):
+                                ws.cell(row=idx, column=current_col + offset).style = name_style if offset == 2 else row_style
                             total_rowFormula = idx
-                            logger.info(f" idx {idx}")
+                            metrics.count("rows")
+                            if debug:
+                                logger.debug(f" idx {idx}")
                         except Exception as e:
                             logger.error(f"Error processing transaction: {str(e)}")
                             continue
                             
                     # Add formulas and totals
-                    logger.info(f" rowformula {total_rowFormula}")
-                    _add_bank_summary(ws, current_col, total_rowFormula)
+                    logger.debug(f" rowformula {total_rowFormula}")
+                    if total_rowFormula:
+                        _add_bank_summary(ws, current_col, total_rowFormula, styles)
+                    else:
+                        # Every task was unreadable: no TOTAL, like a bank without tasks
+                        logger.debug(f"no readable tasks for bank {account.name}")
                     
                    
                     
             except Exception as e:
-                name = account.get('name')
+                name = account.name
                 logger.error(f"Error processing account {name}: {str(e)}")
                 continue
                 
             current_col += 8
         
+        metrics.lap("banks")
+        
         array_length = len(accounts)
         last_row_Bank = array_length
        
         # Add bank summary section
-        _add_bank_list_summary(ws, last_row_Bank,date_range,totals)
+        _add_bank_list_summary(ws, last_row_Bank,date_range,totals,styles)
+        metrics.lap("summary")
         
         # Add branch data
-        _add_branch_data(ws, last_row_Bank,date_range,branch_data)
+        _add_branch_data(ws, last_row_Bank,date_range,branch_data,styles)
+        metrics.lap("branches")
         
         # Set column widths
         for col in range(1, current_col):
@@ -236,8 +175,11 @@ def create_excel_report2(report_id: str,date_range=None,reportdata:dict=None):
         filename = f"financial_report_{report_id}.xlsx"
         filepath = os.path.join(REPORTS_DIR, filename)
         
-       
+        # ws._cells holds every cell touched, styled ones included
+        metrics.count("cells", len(ws._cells))
+        metrics.count("styles", styles.count)
         wb.save(filepath)
+        metrics.lap("save")
         
         # Verify file was created and set permissions
         if not os.path.exists(filepath):
@@ -252,10 +194,10 @@ def create_excel_report2(report_id: str,date_range=None,reportdata:dict=None):
         logger.error(f"Error generating report: {str(e)}")
         raise
 
-def _add_bank_summary(ws, current_col, total_rowFormula,):
+def _add_bank_summary(ws, current_col, total_rowFormula, styles):
     """Helper to add formulas and totals for each bank column"""
     #SUM FOR WITHDRAW
-    logger.info(f"row_bank: {current_col} rowformula {total_rowFormula}")
+    logger.debug(f"row_bank: {current_col} rowformula {total_rowFormula}")
     cell_withdraw = get_column_letter(current_col + 3)
     cell_withdraw_formula = f"=SUM({cell_withdraw}4:{cell_withdraw}{total_rowFormula})"
     ws.cell(row=1, column=current_col+3, value=cell_withdraw_formula)
@@ -271,8 +213,7 @@ def _add_bank_summary(ws, current_col, total_rowFormula,):
     ws.cell(row=total_rowFormula + 1, column=current_col+4, value=cell_DEPOSIT_formula)
     
     #CENTER TOTAL
-    cell = ws.cell(row=total_rowFormula + 1, column=current_col)
-    cell.alignment = Alignment(horizontal='center')
+    ws.cell(row=total_rowFormula + 1, column=current_col).style = styles.get("centered")
     ws.merge_cells(start_row=total_rowFormula + 1, start_column=current_col, 
                    end_row=total_rowFormula + 1, end_column=current_col+1)
                    
@@ -280,30 +221,18 @@ def _add_bank_summary(ws, current_col, total_rowFormula,):
     formula_Total_All = f"=({cell_withdraw}{total_rowFormula+1} - {cell_deposit}{total_rowFormula+1}) * -1"
     ws.cell(row=1, column=current_col+1, value=formula_Total_All)
 
-def _add_bank_list_summary(ws, last_row_Bank,date_range,totals):
+def _add_bank_list_summary(ws, last_row_Bank,date_range,totals,styles):
     """Add summary sections for banks"""
-    light_pink = "FFD9D9"
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
     summary_row = 4 + last_row_Bank 
     # totals = get_total(date_range)
-    ws.cell(row=summary_row, column=1, value="cash")
     #center cash C0C0FF
-    ws.cell(row=summary_row, column=1,).alignment = Alignment(horizontal='center')
-    ws.cell(row=summary_row, column=1,).fill = PatternFill(start_color="FFDCE6F1", end_color="FFDCE6F1", fill_type="solid")
-
-    ws.cell(row=summary_row, column=2, value=f"=SUM(B4:B{3+last_row_Bank})")
-    ws.cell(row=summary_row, column=2,).fill = PatternFill(start_color="FFFFFF66", end_color="FFFFFF66", fill_type="solid")
+    ws.cell(row=summary_row, column=1, value="cash").style = styles.get("cash_label")
+    ws.cell(row=summary_row, column=2, value=f"=SUM(B4:B{3+last_row_Bank})").style = styles.get("cash_value")
     ws.cell(row=summary_row +1, column=1, value="月")
     #merge 月
     ws.merge_cells(start_row=summary_row +1, start_column=1, end_row=summary_row +1, end_column=2)
     # center 月
-    ws.cell(row=summary_row +1, column=1,).alignment = Alignment(horizontal='center')
+    ws.cell(row=summary_row +1, column=1,).style = styles.get("centered")
 
     ws.cell(row=summary_row + 2, column=1, value="自动计算")
     ws.cell(row=summary_row + 2, column=2, value=totals.get('completeTotal'))
@@ -314,40 +243,18 @@ def _add_bank_list_summary(ws, last_row_Bank,date_range,totals):
     ws.cell(row=summary_row + 5, column=1, value="场口已领")
     ws.cell(row=summary_row + 6, column=1, value="")
     ws.cell(row=summary_row + 7, column=1, value="自动计算")
-    #color row C5D9F1 DCE6F1
-    ws.cell(row=summary_row + 2, column=1,).fill = PatternFill(start_color="FFC5D9F1", end_color="FFC5D9F1", fill_type="solid")
-    ws.cell(row=summary_row + 3, column=1,).fill = PatternFill(start_color="FFC5D9F1", end_color="FFC5D9F1", fill_type="solid")
-    ws.cell(row=summary_row + 4, column=1,).fill = PatternFill(start_color="FFC5D9F1", end_color="FFC5D9F1", fill_type="solid")
-    ws.cell(row=summary_row + 5, column=1,).fill = PatternFill(start_color="FFFFFFCC", end_color="FFFFFFCC", fill_type="solid")
-
-    ws.cell(row=summary_row + 2, column=2,).fill = PatternFill(start_color="FFDCE6F1", end_color="FFDCE6F1", fill_type="solid")
-    ws.cell(row=summary_row + 3, column=2,).fill = PatternFill(start_color="FFDCE6F1", end_color="FFDCE6F1", fill_type="solid")
-    ws.cell(row=summary_row +4, column=2,).fill = PatternFill(start_color="FFDCE6F1", end_color="FFDCE6F1", fill_type="solid")
-    ws.cell(row=summary_row + 5, column=2,).fill = PatternFill(start_color="FFFFCC", end_color="FFFFFFCC", fill_type="solid")
+    #color row C5D9F1 DCE6F1, with border
+    for row in (summary_row + 2, summary_row + 3, summary_row + 4):
+        ws.cell(row=row, column=1,).style = styles.get("summary_label")
+        ws.cell(row=row, column=2,).style = styles.get("summary_value")
+    ws.cell(row=summary_row + 5, column=1,).style = styles.get("claimed_label")
+    ws.cell(row=summary_row + 5, column=2,).style = styles.get("claimed_value")
     #border
-    ws.cell(row=summary_row, column=1, ).border  = thin_border
-    ws.cell(row=summary_row, column=2, ).border  = thin_border
-    ws.cell(row=summary_row + 2, column=1, ).border  = thin_border
-    ws.cell(row=summary_row + 2, column=2,).border  = thin_border
-    ws.cell(row=summary_row + 3, column=1, ).border  = thin_border
-    ws.cell(row=summary_row + 3, column=2, ).border  = thin_border
-    ws.cell(row=summary_row + 4, column=1,).border  = thin_border
-    ws.cell(row=summary_row + 4, column=2, ).border  = thin_border
-    ws.cell(row=summary_row + 5, column=1, ).border  = thin_border
-    ws.cell(row=summary_row + 5, column=2, ).border  = thin_border
-    ws.cell(row=summary_row + 7, column=1, ).border  = thin_border
-    ws.cell(row=summary_row + 7, column=2, ).border  = thin_border
-
-def _add_branch_data(ws, last_row_Bank,date_range,branch_data):
+    ws.cell(row=summary_row + 7, column=1, ).style = styles.get("bordered")
+    ws.cell(row=summary_row + 7, column=2, ).style = styles.get("bordered")
+
+def _add_branch_data(ws, last_row_Bank,date_range,branch_data,styles):
     """Add branch data to the report"""
-    light_pink = "FFD9D9"
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
     branches = branch_data
     if not branches:
         raise ValueError("No branches found")
@@ -361,17 +268,11 @@ def _add_branch_data(ws, last_row_Bank,date_range,branch_data):
             # total = getattr(branch, 'total', '') or ''
             code = branch.get('code')
             total= branch.get('amount')
-            color_branch = get_color_by_code(code)
             # Branch code
-            cell = ws.cell(row=idx, column=1, value=f"{code}".strip())
-            cell.fill = PatternFill(start_color=color_branch, end_color=color_branch, fill_type="solid")
-            cell.border = thin_border
-            cell.alignment = Alignment(wrap_text=True)
+            ws.cell(row=idx, column=1, value=f"{code}".strip()).style = styles.branch(code, wrap_text=True)
             
             # Total amount
-            cell = ws.cell(row=idx, column=2, value=total)
-            cell.fill = PatternFill(start_color=color_branch, end_color=color_branch, fill_type="solid")
-            cell.border = thin_border
+            ws.cell(row=idx, column=2, value=total).style = styles.branch(code)
             lastBranchRow = idx
         except Exception as e:
             logger.error(f"Error adding branch to report: {str(e)}")
@@ -380,6 +281,372 @@ def _add_branch_data(ws, last_row_Bank,date_range,branch_data):
     summary_row = last_row_Bank +9
     logger.info(f"Successfully lastBranchRow sii: {last_row_Bank}")
     ws.cell(row=summary_row   , column=2, value=f"=SUM({cell_withdraw}{branch_start_row}:{cell_withdraw}{lastBranchRow+8})")
+def create_excel_report2_write_only(report_id: str, date_range=None, reportdata: dict = None, metrics: ReportMetrics = None,
+                                    banks_per_sheet: int = None, sheet_workers: int = None):
+    """Write the create_excel_report2 layout row by row on a write-only workbook"""
+    try:
+        logger.info(f"Starting write-only report generation for report_id: {report_id}")
+
+        filename = f"financial_report_{report_id}.xlsx"
+        filepath = os.path.join(REPORTS_DIR, filename)
+
+        write_report2_write_only(filepath, date_range, reportdata, metrics, banks_per_sheet, sheet_workers)
+
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Failed to create file at {filepath}")
+
+        os.chmod(filepath, 0o666)
+
+        return filename
+
+    except Exception as e:
+        logger.error(f"Error generating write-only report: {str(e)}")
+        raise
+
+def render_report2_bytes(date_range=None, reportdata: dict = None, banks_per_sheet: int = None):
+    """Render the create_excel_report2 layout in memory, for reports small enough to return in one response"""
+    buffer = io.BytesIO()
+    write_report2_write_only(buffer, date_range, reportdata, banks_per_sheet=banks_per_sheet)
+    return buffer.getvalue()
+
+def write_report2_write_only(output, date_range=None, reportdata: dict = None, metrics: ReportMetrics = None,
+                             banks_per_sheet: int = None, sheet_workers: int = None):
+    """Build the write-only workbook and save it to a path or a binary file object
+
+    With banks_per_sheet, the banks are split over sheets of that many banks each, after
+    a Summary sheet holding columns A:B (bank list, cash summary and branch block). Up to
+    sheet_workers (default REPORT_SHEET_WORKERS) of those sheets are rendered at once.
+    """
+    if metrics is None:
+        metrics = ReportMetrics()
+    if sheet_workers is None:
+        sheet_workers = REPORT_SHEET_WORKERS
+    if not date_range:
+        today = datetime.now().strftime('%Y-%m-%d')
+        date_range = (f"{today} 00:00:00", f"{today} 23:59:59")
+    accounts = reportdata.get("result", []) if reportdata else []
+    branch_data = reportdata.get("branch", []) if reportdata else []
+    totals = reportdata.get("total", {}) if reportdata else {
+        "pendingTotal": 0,
+        "completeTotal": 0,
+        "grandTotal": 0
+    }
+    if not accounts:
+        raise ValueError("No accounts found")
+    if not branch_data:
+        raise ValueError("No branches found")
+    if banks_per_sheet is not None and banks_per_sheet < 1:
+        raise ValueError("banks_per_sheet must be at least 1")
+    if banks_per_sheet and sheet_workers > 1 and len(accounts) > banks_per_sheet:
+        # The workers parse their own banks, so the payload is handed over as it came
+        _write_sheets_parallel(output, accounts, totals, branch_data, banks_per_sheet, sheet_workers, metrics)
+        return
+    accounts = normalize_reportdata(reportdata)
+    metrics.lap("parse")
+
+    wb = Workbook(write_only=True)
+    styles = StyleRegistry(wb)
+    summary_merge = _summary_merge(len(accounts))
+
+    if not banks_per_sheet:
+        ws = wb.create_sheet()
+        # Bank list names point at each bank's header cell
+        bank_refs = [f"{get_column_letter(3 + 8 * idx)}2" for idx in range(len(accounts))]
+        side_rows = _write_only_side_rows(ws, styles, accounts, bank_refs, totals, branch_data, metrics)
+        _write_only_sheet(ws, styles, accounts, side_rows, [summary_merge], metrics)
+    else:
+        shards = _shards(len(accounts), banks_per_sheet)
+        summary_ws = wb.create_sheet("Summary")
+        side_rows = _write_only_side_rows(summary_ws, styles, accounts, _shard_bank_refs(shards),
+                                          totals, branch_data, metrics)
+        _write_only_sheet(summary_ws, styles, [], side_rows, [summary_merge], metrics)
+        for title, start, stop in shards:
+            _write_only_sheet(wb.create_sheet(title), styles, accounts[start:stop], {}, [], metrics)
+
+    metrics.count("styles", styles.count)
+    wb.save(output)
+    metrics.lap("save")
+
+def _summary_merge(bank_count):
+    """The 月 row under the cash total, merged across A:B"""
+    return f"A{4 + bank_count + 1}:B{4 + bank_count + 1}"
+
+def _shards(bank_count, banks_per_sheet):
+    """(title, start, stop) of each bank sheet: "Banks 1-10", "Banks 11-20", ..."""
+    shards = []
+    for start in range(0, bank_count, banks_per_sheet):
+        stop = min(start + banks_per_sheet, bank_count)
+        title = f"Banks {start + 1}-{stop}" if stop - start > 1 else f"Banks {start + 1}"
+        shards.append((title, start, stop))
+    return shards
+
+def _shard_bank_refs(shards):
+    """Header cell of every bank as a cross-sheet reference, e.g. 'Banks 11-20'!K2"""
+    return [f"'{title}'!{get_column_letter(3 + 8 * (idx - start))}2"
+            for title, start, stop in shards for idx in range(start, stop)]
+
+def _write_sheets_parallel(output, accounts, totals, branch_data, banks_per_sheet, sheet_workers, metrics):
+    """Sharded layout with every sheet rendered in a worker process, then zipped into one package
+
+    Each worker saves a workbook holding just its sheet. All of them, and the skeleton
+    package here, register the same styles in the same order first, so their sheet XML
+    uses the skeleton's style ids and can be copied in as is; strings are inline.
+    """
+    shards = _shards(len(accounts), banks_per_sheet)
+    # The Summary only reads each bank's name, number and total
+    headers = [_bank_header(account) for account in accounts]
+    parts = [("Summary", headers, (totals, branch_data, _shard_bank_refs(shards)))]
+    parts += [(title, accounts[start:stop], None) for title, start, stop in shards]
+
+    skeleton = io.BytesIO()
+    wb = Workbook(write_only=True)
+    styles = StyleRegistry(wb)
+    styles.register_all()
+    for title, _, _ in parts:
+        wb.create_sheet(title)
+    wb.save(skeleton)
+    metrics.lap("parse")
+
+    # spawn, like report_executor, so workers start clean
+    with ProcessPoolExecutor(max_workers=min(sheet_workers, len(parts)),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        rendered = list(pool.map(_render_sheet_part, *zip(*parts)))
+    metrics.lap("banks")
+
+    with zipfile.ZipFile(skeleton) as source:
+        styles_xml = source.read("xl/styles.xml")
+        # Worksheets are numbered in creation order
+        sheets = {f"xl/worksheets/sheet{idx}.xml": sheet_xml
+                  for idx, (sheet_xml, _, _) in enumerate(rendered, start=1)}
+        for _, part_styles, counters in rendered:
+            if part_styles != styles_xml:
+                raise RuntimeError("Sheet rendered with different styles than the workbook")
+            for name, amount in counters.items():
+                metrics.count(name, amount)
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as package:
+            for item in source.infolist():
+                package.writestr(item, sheets[item.filename] if item.filename in sheets else source.read(item))
+    metrics.count("styles", styles.count)
+    metrics.lap("save")
+
+def _bank_header(account):
+    """A bank of the payload without its tasks, from a task dict or a BankColumns"""
+    if isinstance(account, BankColumns):
+        return {"name": account.name, "accountNo": account.account_no, "totalAmount": account.total_amount}
+    return {key: value for key, value in account.items() if key != "tasks"}
+
+def _render_sheet_part(title, accounts, summary=None):
+    """Worker process: one sheet of the sharded layout as (sheet XML, styles XML, counters)
+
+    summary is (totals, branch_data, bank_refs) for the Summary sheet, None for a bank sheet.
+    """
+    metrics = ReportMetrics()
+    wb = Workbook(write_only=True)
+    styles = StyleRegistry(wb)
+    styles.register_all()
+    ws = wb.create_sheet(title)
+    accounts = normalize_reportdata({"result": accounts})
+    if summary is None:
+        _write_only_sheet(ws, styles, accounts, {}, [], metrics)
+    else:
+        totals, branch_data, bank_refs = summary
+        side_rows = _write_only_side_rows(ws, styles, accounts, bank_refs, totals, branch_data, metrics)
+        _write_only_sheet(ws, styles, [], side_rows, [_summary_merge(len(accounts))], metrics)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    with zipfile.ZipFile(buffer) as package:
+        return package.read("xl/worksheets/sheet1.xml"), package.read("xl/styles.xml"), metrics.counters
+
+def _write_only_sheet(ws, styles, accounts, side_rows, side_merges, metrics):
+    """Stream one sheet: headers, the accounts' bank blocks from column C and side_rows in A:B"""
+    # Column widths must be set before the first row is written
+    last_col = len(accounts) * 8 + 2
+    for col in range(1, last_col + 1):
+        ws.column_dimensions[get_column_letter(col)].width = 15
+
+    # Each bank block: (first column, BankColumns, TOTAL row or None when it has no readable tasks)
+    banks = []
+    current_col = 3
+    for account in accounts:
+        banks.append((current_col, account, _total_row(account)))
+        current_col += 8
+    metrics.lap("layout")
+
+    max_row = max([3] + list(side_rows) + [total_row for _, _, total_row in banks if total_row])
+
+    for row_idx in range(1, max_row + 1):
+        if row_idx <= 3:
+            row_cells = _write_only_header_row(ws, styles, row_idx, accounts, banks)
+            if row_idx == 3:
+                metrics.lap("layout")
+        else:
+            row_cells = dict(side_rows.get(row_idx, {}))
+            for col, account, total_row in banks:
+                if total_row is None or row_idx > total_row:
+                    continue
+                if row_idx == total_row:
+                    row_cells.update(_write_only_total_cells(ws, styles, col, total_row))
+                elif account.dates[row_idx - 4] is not None:
+                    row_cells.update(_write_only_task_cells(ws, styles, col, account, row_idx - 4))
+                    metrics.count("rows")
+        width = max(row_cells) if row_cells else 0
+        ws.append([row_cells.get(col) for col in range(1, width + 1)])
+        metrics.count("cells", len(row_cells))
+
+    # Merged ranges are written after sheetData, so they can be registered last
+    ws.merged_cells.add("A2:B2")
+    for merge in side_merges:
+        ws.merged_cells.add(merge)
+    for col, _, total_row in banks:
+        ws.merged_cells.add(f"{get_column_letter(col)}2:{get_column_letter(col + 5)}2")
+        if total_row:
+            ws.merged_cells.add(f"{get_column_letter(col)}{total_row}:{get_column_letter(col + 1)}{total_row}")
+    metrics.lap("banks")
+
+def _total_row(account):
+    """Row of a bank block's TOTAL, right under its last readable task, or None when it has none"""
+    for position in range(len(account) - 1, -1, -1):
+        if account.dates[position] is not None:
+            return position + 5
+    return None
+
+def _write_only_cell(ws, value=None, style=None):
+    """Build a WriteOnlyCell with a named style from the StyleRegistry"""
+    cell = WriteOnlyCell(ws, value=value)
+    if style is not None:
+        cell.style = style
+    return cell
+
+def _write_only_header_row(ws, styles, row_idx, accounts, banks):
+    """Cells for rows 1-3: top totals, bank names and column headers"""
+    cells = {}
+    if row_idx == 1:
+        for col in range(1, len(accounts) * 8 + 3):
+            cells[col] = _write_only_cell(ws, 0, styles.get("top_total"))
+        for col, _, total_row in banks:
+            if not total_row:
+                continue
+            cell_withdraw = get_column_letter(col + 3)
+            cell_deposit = get_column_letter(col + 4)
+            cells[col + 1].value = f"=({cell_withdraw}{total_row} - {cell_deposit}{total_row}) * -1"
+            cells[col + 3].value = f"=SUM({cell_withdraw}4:{cell_withdraw}{total_row - 1})"
+            cells[col + 4].value = f"=SUM({cell_deposit}4:{cell_deposit}{total_row - 1})"
+    elif row_idx == 2:
+        cells[1] = _write_only_cell(ws, "进出账记录", styles.get("title"))
+        red = InlineFont(color='FF0000')
+        black = InlineFont(color='000000')
+        # Merged cells keep the edge borders of the top left cell
+        for col, account, _ in banks:
+            rich_string = CellRichText([TextBlock(black, account.name + ' '), TextBlock(red, account.account_no)])
+            cells[col] = _write_only_cell(ws, rich_string, styles.get("bank_header"))
+            for offset in range(1, 5):
+                cells[col + offset] = _write_only_cell(ws, style=styles.get("bank_header_merged"))
+            cells[col + 5] = _write_only_cell(ws, style=styles.get("bank_header_merged_end"))
+    else:
+        cells[1] = _write_only_cell(ws, "底线", styles.get("baseline"))
+        headers = ["Date", "Note", "Name", "Withdraw", "deposit", "Time", "Approve"]
+        for col, _, _ in banks:
+            for offset, header in enumerate(headers):
+                cells[col + offset] = _write_only_cell(ws, header, styles.get("column_header"))
+    return cells
+
+def _write_only_task_cells(ws, styles, col, account, position):
+    """Cells for one transaction row of a bank block"""
+    try:
+        code = account.codes[position]
+        row_style = styles.branch(code)
+        name_style = row_style
+        withdraw = deposit = None
+        if account.withdraw[position]:
+            withdraw = account.amounts[position]
+        else:
+            name_style = styles.branch(code, wrap_text=True)
+            deposit = account.amounts[position]
+
+        values = [account.dates[position], code, account.label(position), withdraw, deposit,
+                  account.times[position], account.admins[position]]
+        return {col + offset: _write_only_cell(ws, value, name_style if offset == 2 else row_style)
+                for offset, value in enumerate(values)}
+    except Exception as e:
+        logger.error(f"Error processing transaction: {str(e)}")
+        return {}
+
+def _write_only_total_cells(ws, styles, col, total_row):
+    """Cells for the TOTAL row under a bank block"""
+    cell_withdraw = get_column_letter(col + 3)
+    cell_deposit = get_column_letter(col + 4)
+    return {
+        col: _write_only_cell(ws, "TOTAL", styles.get("centered")),
+        col + 3: _write_only_cell(ws, f"=SUM({cell_withdraw}4:{cell_withdraw}{total_row - 1})"),
+        col + 4: _write_only_cell(ws, f"=SUM({cell_deposit}4:{cell_deposit}{total_row - 1})"),
+    }
+
+def _write_only_side_rows(ws, styles, accounts, bank_refs, totals, branch_data, metrics):
+    """Cells for columns A:B from row 4 down: bank list, cash summary and branch block
+
+    bank_refs holds the header cell of each account, named by the bank list formulas.
+    """
+    rows = {}
+
+    # Bank list
+    row_bank = 4
+    for account, bank_ref in zip(accounts, bank_refs):
+        rows[row_bank] = {
+            1: _write_only_cell(ws, f"={bank_ref}", styles.get("bank_name")),
+            2: _write_only_cell(ws, account.total_amount, styles.get("bank_amount")),
+        }
+        row_bank += 1
+
+    # Summary, same cells as _add_bank_list_summary
+    last_row_Bank = len(accounts)
+    summary_row = 4 + last_row_Bank
+    rows[summary_row] = {
+        1: _write_only_cell(ws, "cash", styles.get("cash_label")),
+        2: _write_only_cell(ws, f"=SUM(B4:B{3+last_row_Bank})", styles.get("cash_value")),
+    }
+    rows[summary_row + 1] = {1: _write_only_cell(ws, "月", styles.get("centered"))}
+    rows[summary_row + 2] = {
+        1: _write_only_cell(ws, "自动计算", styles.get("summary_label")),
+        2: _write_only_cell(ws, totals.get('completeTotal'), styles.get("summary_value")),
+    }
+    rows[summary_row + 3] = {
+        1: _write_only_cell(ws, "今日未领", styles.get("summary_label")),
+        2: _write_only_cell(ws, totals.get('pendingTotal'), styles.get("summary_value")),
+    }
+    rows[summary_row + 4] = {
+        1: _write_only_cell(ws, "TOTAL", styles.get("summary_label")),
+        2: _write_only_cell(ws, f"=SUM(B{summary_row + 2}:B{summary_row + 3})", styles.get("summary_value")),
+    }
+    rows[summary_row + 5] = {
+        1: _write_only_cell(ws, "场口已领", styles.get("claimed_label")),
+        2: _write_only_cell(ws, style=styles.get("claimed_value")),
+    }
+    rows[summary_row + 6] = {1: _write_only_cell(ws, "")}
+    rows[summary_row + 7] = {
+        1: _write_only_cell(ws, "自动计算", styles.get("bordered")),
+        2: _write_only_cell(ws, style=styles.get("bordered")),
+    }
+    metrics.lap("summary")
+
+    # Branch block, same cells as _add_branch_data
+    branch_start_row = 4 + last_row_Bank + 8
+    lastBranchRow = 0
+    for idx, branch in enumerate(branch_data, start=branch_start_row):
+        try:
+            code = branch.get('code')
+            total = branch.get('amount')
+            rows[idx] = {
+                1: _write_only_cell(ws, f"{code}".strip(), styles.branch(code, wrap_text=True)),
+                2: _write_only_cell(ws, total, styles.branch(code)),
+            }
+            lastBranchRow = idx
+        except Exception as e:
+            logger.error(f"Error adding branch to report: {str(e)}")
+            continue
+    rows[summary_row + 5][2].value = f"=SUM(B{branch_start_row}:B{lastBranchRow+8})"
+    metrics.lap("branches")
+    return rows
+
 def get_color_by_code(code):
     """Get hex color code by color reference code"""
     return color_code_mapping.get(code, "FFFFFFFF")
\ No newline at end of file
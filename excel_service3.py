@@ -8,6 +8,7 @@ import pytz
 from datetime import datetime
 
 from config import logger, REPORTS_DIR, malaysia_tz,color_code_mapping
+from report_columns import normalize_reportdata
 from data_service import get_accounts, get_banks, get_transactions,get_transactions2, get_branches,get_total
 
 def create_excel_report3(report_id: str, date_range=None, reportdata: dict = None):
@@ -31,7 +32,7 @@ def create_excel_report3(report_id: str, date_range=None, reportdata: dict = Non
         )
 
         # Extract data from reportdata
-        accounts = reportdata.get("result", []) if reportdata else []
+        accounts = normalize_reportdata(reportdata)
         branch_data = reportdata.get("branch", []) if reportdata else []
         totals = reportdata.get("total", {}) if reportdata else {
             "pendingTotal": 0,
@@ -58,8 +59,8 @@ def create_excel_report3(report_id: str, date_range=None, reportdata: dict = Non
 
         current_col = 3
         for account in accounts:
-            name = account.get("name", "") or ""
-            account_no = account.get("accountNo", "") or ""
+            name = account.name
+            account_no = account.account_no
             cell = ws.cell(row=2, column=current_col)
 
             # Rich text: black name + red account number
@@ -91,37 +92,30 @@ def create_excel_report3(report_id: str, date_range=None, reportdata: dict = Non
         max_row = 4  # Track max row used across all banks
 
         for account in accounts:
-            tasks = account.get("tasks", [])
             total_rowFormula = 3  # Will be updated per account
 
             row_idx = 4
-            for task in tasks:
+            for position in range(len(account)):
+                date_str = account.dates[position]
+                if date_str is None:
+                    # Unreadable task, already logged by normalize_reportdata
+                    continue
                 try:
-                    created_at = task.get("date")
-                    if created_at:
-                        # Parse ISO format
-                        dt = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
-                        dt = dt.astimezone(malaysia_tz)
-                        date_str = dt.strftime('%d-%m-%Y')
-                        time_str = dt.strftime('%H:%M:%S')
-                    else:
-                        date_str = time_str = ''
-
-                    code = task.get("branchs", {}).get("code", "")
+                    code = account.codes[position]
                     color_Branch = color_code_mapping.get(code, "FFFFFF")
 
                     # Write data
                     ws.cell(row=row_idx, column=current_col, value=date_str).border = thin_border
                     ws.cell(row=row_idx, column=current_col + 1, value=code).border = thin_border
-                    ws.cell(row=row_idx, column=current_col + 2, value=task.get("name", "")).alignment = Alignment(wrap_text=True)
+                    ws.cell(row=row_idx, column=current_col + 2, value=account.names[position]).alignment = Alignment(wrap_text=True)
                     ws.cell(row=row_idx, column=current_col + 2).border = thin_border
 
-                    if task.get("type") == "WITHDRAW":
-                        ws.cell(row=row_idx, column=current_col + 3, value=task.get("amount", 0)).border = thin_border
+                    if account.withdraw[position]:
+                        ws.cell(row=row_idx, column=current_col + 3, value=account.amounts[position]).border = thin_border
                     else:
-                        ws.cell(row=row_idx, column=current_col + 4, value=task.get("amount", 0)).border = thin_border
+                        ws.cell(row=row_idx, column=current_col + 4, value=account.amounts[position]).border = thin_border
 
-                    ws.cell(row=row_idx, column=current_col + 5, value=time_str).border = thin_border
+                    ws.cell(row=row_idx, column=current_col + 5, value=account.times[position]).border = thin_border
 
                     # Fill color by branch
                     for i in range(6):
@@ -131,7 +125,7 @@ def create_excel_report3(report_id: str, date_range=None, reportdata: dict = Non
                     row_idx += 1
                     total_rowFormula = row_idx - 1
                 except Exception as e:
-                    logger.error(f"Error processing task {task.get('id')}: {str(e)}")
+                    logger.error(f"Error processing task {position} of bank {account.name}: {str(e)}")
                     continue
 
             # Add SUM formulas for this bank
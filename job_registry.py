@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import sqlite3
+import uuid
+from contextlib import closing
+from datetime import datetime
+
+from config import logger, JOBS_DB, REPORTS_DIR
+from report_metrics import ReportMetrics
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+EXPIRED = "expired"
+
+
+def _read_boot_id():
+    """Kernel boot id, so a pid recorded before a reboot is not mistaken for a live process"""
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+BOOT_ID = _read_boot_id()
+
+
+def _connect():
+    conn = sqlite3.connect(JOBS_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_registry():
+    """Create the jobs table if needed"""
+    with closing(_connect()) as conn, conn:
+        # WAL lets the API read job states while workers write them
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS report_jobs (
+                report_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                start_date TEXT,
+                end_date TEXT,
+                filename TEXT,
+                row_count INTEGER,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                cache_key TEXT,
+                file_size INTEGER,
+                file_sha256 TEXT,
+                last_used_at TEXT,
+                metrics TEXT,
+                owner_pid INTEGER,
+                owner_boot_id TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS report_jobs_cache_key_idx ON report_jobs (cache_key)")
+        conn.execute("CREATE INDEX IF NOT EXISTS report_jobs_filename_idx ON report_jobs (filename)")
+
+def new_report_id():
+    """Timestamped report id with a random suffix, unique even within the same second"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+def create_job(report_id, date_range, row_count=None, cache_key=None):
+    start_date, end_date = date_range
+    with closing(_connect()) as conn, conn:
+        conn.execute("""
+            INSERT INTO report_jobs (report_id, state, start_date, end_date, row_count, cache_key, created_at,
+                                     owner_pid, owner_boot_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (report_id, QUEUED, start_date, end_date, row_count, cache_key, datetime.now().isoformat(),
+              os.getpid(), BOOT_ID))
+
+def delete_job(report_id):
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM report_jobs WHERE report_id = ?", (report_id,))
+
+def get_job(report_id):
+    """Job record as a dict, or None for an unknown id"""
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM report_jobs WHERE report_id = ?", (report_id,)).fetchone()
+        return dict(row) if row else None
+
+def find_job_by_cache_key(cache_key):
+    """Newest queued, running or done job for a cache key, or None"""
+    with closing(_connect()) as conn:
+        row = conn.execute("""
+            SELECT * FROM report_jobs
+            WHERE cache_key = ? AND state IN (?, ?, ?)
+            ORDER BY created_at DESC LIMIT 1
+        """, (cache_key, QUEUED, RUNNING, DONE)).fetchone()
+        return dict(row) if row else None
+
+def find_done_job_by_filename(filename):
+    """Done job that produced a report file, or None"""
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM report_jobs WHERE filename = ? AND state = ?",
+                           (filename, DONE)).fetchone()
+        return dict(row) if row else None
+
+def list_done_jobs():
+    """Done jobs, least recently used first"""
+    with closing(_connect()) as conn:
+        rows = conn.execute("""
+            SELECT * FROM report_jobs WHERE state = ?
+            ORDER BY COALESCE(last_used_at, finished_at)
+        """, (DONE,)).fetchall()
+        return [dict(row) for row in rows]
+
+def done_totals():
+    """(file count, total bytes) of the reports done jobs keep in REPORTS_DIR"""
+    with closing(_connect()) as conn:
+        count, size = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM report_jobs WHERE state = ?
+        """, (DONE,)).fetchone()
+        return count, size
+
+def touch(report_id):
+    """Record that a report was served, for LRU eviction"""
+    _update(report_id, last_used_at=datetime.now().isoformat())
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hex sha256 of a file's content, read a chunk at a time"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def set_file_sha256(report_id, sha256):
+    _update(report_id, file_sha256=sha256)
+
+def _update(report_id, **fields):
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with closing(_connect()) as conn, conn:
+        conn.execute(f"UPDATE report_jobs SET {columns} WHERE report_id = ?", (*fields.values(), report_id))
+
+def mark_running(report_id):
+    _update(report_id, state=RUNNING, started_at=datetime.now().isoformat())
+
+def mark_done(report_id, filename, file_size=None, metrics=None, file_sha256=None):
+    _update(report_id, state=DONE, filename=filename, file_size=file_size, metrics=metrics,
+            file_sha256=file_sha256, finished_at=datetime.now().isoformat())
+
+def mark_failed(report_id, error, metrics=None):
+    _update(report_id, state=FAILED, error=error, metrics=metrics, finished_at=datetime.now().isoformat())
+
+def fail_unfinished(report_id, error):
+    """Mark a job failed if it is still queued or running, returning whether it was"""
+    with closing(_connect()) as conn, conn:
+        result = conn.execute("""
+            UPDATE report_jobs SET state = ?, error = ?, finished_at = ?
+            WHERE report_id = ? AND state IN (?, ?)
+        """, (FAILED, error, datetime.now().isoformat(), report_id, QUEUED, RUNNING))
+        return result.rowcount > 0
+
+def mark_expired(report_id):
+    _update(report_id, state=EXPIRED, cache_key=None)
+
+def _owner_alive(owner_pid, owner_boot_id):
+    """Whether the process that queued a job is still running; our own pid counts as dead at startup"""
+    if owner_pid is None or owner_boot_id != BOOT_ID or owner_pid == os.getpid():
+        return False
+    try:
+        os.kill(owner_pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def fail_interrupted_jobs():
+    """Fail jobs left queued or running by a process that has exited, so clients stop polling them.
+
+    Jobs owned by other live API workers are left alone.
+    """
+    with closing(_connect()) as conn, conn:
+        rows = conn.execute("""
+            SELECT report_id, owner_pid, owner_boot_id FROM report_jobs WHERE state IN (?, ?)
+        """, (QUEUED, RUNNING)).fetchall()
+        orphaned = [(row["report_id"],) for row in rows
+                    if not _owner_alive(row["owner_pid"], row["owner_boot_id"])]
+        now = datetime.now().isoformat()
+        conn.executemany("""
+            UPDATE report_jobs SET state = ?, error = ?, finished_at = ?
+            WHERE report_id = ? AND state IN (?, ?)
+        """, [(FAILED, "Interrupted by server restart", now, report_id, QUEUED, RUNNING)
+              for (report_id,) in orphaned])
+        if orphaned:
+            logger.info(f"Marked {len(orphaned)} interrupted report jobs as failed")
+
+def job_metrics(job):
+    """Metrics dict stored on a job record, or None"""
+    return json.loads(job["metrics"]) if job and job.get("metrics") else None
+
+def run_job(report_id, fn, *args, **kwargs):
+    """Run a report function in a worker, recording its state and metrics in the registry"""
+    mark_running(report_id)
+    metrics = ReportMetrics()
+    try:
+        filename = fn(*args, metrics=metrics, **kwargs)
+    except Exception as e:
+        mark_failed(report_id, str(e), json.dumps(metrics.as_dict()))
+        raise
+    # The content hash is the report's ETag; files are never rewritten once done
+    filepath = os.path.join(REPORTS_DIR, filename)
+    mark_done(report_id, filename, os.path.getsize(filepath), json.dumps(metrics.as_dict()), file_sha256(filepath))
+    return filename
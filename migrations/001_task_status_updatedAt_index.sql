@@ -0,0 +1,4 @@
+-- Supports data_service.get_total: the pending branch is a range on status,
+-- the complete branch a range on (status, updatedAt). type and amount are
+-- included so the totals are read from the index without touching the rows.
+CREATE INDEX Task_status_updatedAt_idx ON Task (status, updatedAt, type, amount);
@@ -0,0 +1,14 @@
+-- Append-only ledger of balance changes, see balance_ledger.py. create_task inserts
+-- a row here instead of updating Bank.balance, so concurrent tasks on the same bank
+-- do not queue on its row lock. The compactor folds rows into Bank.balance and
+-- deletes them; the current balance is Bank.balance plus the rows still here.
+-- amount matches Prisma's default Decimal column.
+CREATE TABLE BankBalanceDelta (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    bankId INT NOT NULL,
+    taskId VARCHAR(191) NULL,
+    amount DECIMAL(65, 30) NOT NULL,
+    createdAt DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    PRIMARY KEY (id),
+    KEY BankBalanceDelta_bankId_idx (bankId)
+);
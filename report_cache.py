@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from config import (logger, REPORTS_DIR, UPLOAD_DIR, REPORT_CACHE_MAX_BYTES, REPORT_CACHE_MAX_FILES,
+                    REPORT_MAX_AGE_SECONDS, REPORT_JOB_TIMEOUT)
+import job_registry
+import report_metrics
+
+
+def cache_key(date_range, options):
+    """sha256 of the canonical JSON of the date range and the non None options, such as the body's digest"""
+    options = {name: value for name, value in options.items() if value is not None}
+    key = [list(date_range), options]
+    payload = json.dumps(key, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def lookup(key):
+    """Job that already produced, or is producing, the report for a cache key, or None"""
+    job = job_registry.find_job_by_cache_key(key)
+    if job is None:
+        return None
+    if job["state"] in (job_registry.QUEUED, job_registry.RUNNING):
+        # A job whose worker died without the API noticing, such as one from a previous process
+        since = datetime.fromisoformat(job["started_at"] or job["created_at"])
+        if datetime.now() - since > timedelta(seconds=REPORT_JOB_TIMEOUT):
+            job_registry.fail_unfinished(job["report_id"], f"Report job timed out after {REPORT_JOB_TIMEOUT} seconds")
+            logger.warning(f"Report job {job['report_id']} timed out, not reusing it for {key}")
+            return None
+    elif job["state"] == job_registry.DONE:
+        if not os.path.exists(os.path.join(REPORTS_DIR, job["filename"])):
+            job_registry.mark_expired(job["report_id"])
+            return None
+        job_registry.touch(job["report_id"])
+    logger.info(f"Report cache hit for {key}: {job['report_id']}")
+    return job
+
+def evict(max_bytes=REPORT_CACHE_MAX_BYTES, max_files=REPORT_CACHE_MAX_FILES, jobs=None):
+    """Delete least recently used report files until the cache is within its limits"""
+    if jobs is None:
+        jobs = job_registry.list_done_jobs()
+    total_bytes = sum(job["file_size"] or 0 for job in jobs)
+    total_files = len(jobs)
+    for job in jobs:
+        if total_bytes <= max_bytes and total_files <= max_files:
+            break
+        if not _remove_report(job, "size"):
+            continue
+        total_bytes -= job["file_size"] or 0
+        total_files -= 1
+
+def expire_old(max_age=REPORT_MAX_AGE_SECONDS, jobs=None):
+    """Delete reports not downloaded, or finished if never downloaded, for max_age seconds
+
+    Returns the done jobs that are kept, least recently used first.
+    """
+    if jobs is None:
+        jobs = job_registry.list_done_jobs()
+    cutoff = datetime.now() - timedelta(seconds=max_age)
+    for position, job in enumerate(jobs):
+        last_used = job["last_used_at"] or job["finished_at"]
+        if last_used and datetime.fromisoformat(last_used) >= cutoff:
+            return jobs[position:]
+        _remove_report(job, "age")
+    return []
+
+def remove_orphans(max_age=REPORT_MAX_AGE_SECONDS, jobs=None):
+    """Delete files older than max_age that no done job serves
+
+    These are reports of jobs that expired or failed after writing, and uploads of jobs
+    that were interrupted. Newer files may belong to a job that is still running.
+    """
+    if jobs is None:
+        jobs = job_registry.list_done_jobs()
+    kept = {job["filename"] for job in jobs}
+    cutoff = time.time() - max_age
+    for directory in (REPORTS_DIR, UPLOAD_DIR):
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if directory == REPORTS_DIR and entry.name in kept:
+                continue
+            try:
+                stat = entry.stat()
+                if not entry.is_file() or stat.st_mtime >= cutoff:
+                    continue
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"Error removing orphaned file {entry.path}: {str(e)}")
+                continue
+            report_metrics.record_eviction("orphan", stat.st_size)
+            logger.info(f"Removed orphaned file {entry.path}")
+
+def sweep(max_age=REPORT_MAX_AGE_SECONDS, max_bytes=REPORT_CACHE_MAX_BYTES, max_files=REPORT_CACHE_MAX_FILES):
+    """Apply the retention policy: expire old reports, then evict down to the cache limits"""
+    jobs = expire_old(max_age, job_registry.list_done_jobs())
+    evict(max_bytes, max_files, jobs)
+    remove_orphans(max_age, job_registry.list_done_jobs())
+
+def _remove_report(job, reason):
+    """Delete a done job's file and mark it expired, returning False if the file could not be removed"""
+    try:
+        os.remove(os.path.join(REPORTS_DIR, job["filename"]))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Error evicting report {job['filename']}: {str(e)}")
+        return False
+    job_registry.mark_expired(job["report_id"])
+    report_metrics.record_eviction(reason, job["file_size"] or 0)
+    logger.info(f"Evicted report {job['filename']} ({reason})")
+    return True
@@ -0,0 +1,207 @@
+import json
+import zlib
+from decimal import Decimal
+from typing import Any, List, Optional, TypedDict, Union
+
+try:
+    import msgspec
+except ImportError:  # Without msgspec the stdlib json module decodes and nothing checks reportdata
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack bodies need msgspec or msgpack
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # zstd bodies are refused without it
+    zstandard = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+# Most decompressed output produced at once while decoding a body
+DECOMPRESS_CHUNK = 64 * 1024
+# zstd input fed at once: a block of up to 128 KiB can be encoded in 4 bytes, so a slice
+# this size inflates to at most about 2 MiB
+_ZSTD_SLICE = 64
+_ZLIB_DECOMPRESS = type(zlib.decompressobj())
+_DECOMPRESS_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+# Typed schema of the reportdata fields the renderers read. Other fields are dropped while
+# decoding, so a payload is decoded and checked in one pass into the same plain dicts.
+
+Number = Union[int, float, str, None]
+
+
+class Branch(TypedDict, total=False):
+    code: Union[str, int, None]
+
+
+class Named(TypedDict, total=False):
+    name: Optional[str]
+
+
+class WithdrawBank(TypedDict, total=False):
+    bankAccountName: Optional[str]
+
+
+class Task(TypedDict, total=False):
+    date: Optional[str]
+    type: Optional[str]
+    amount: Number
+    name: Optional[str]
+    branchs: Optional[Branch]
+    users: Optional[Named]
+    bank2: Optional[Named]
+    WithdrawBank: Optional[WithdrawBank]
+
+
+class Account(TypedDict, total=False):
+    name: Optional[str]
+    accountNo: Union[str, int, None]
+    totalAmount: Number
+    tasks: Optional[List[Task]]
+
+
+class BranchTotal(TypedDict, total=False):
+    code: Union[str, int, None]
+    amount: Number
+
+
+class Totals(TypedDict, total=False):
+    pendingTotal: Number
+    completeTotal: Number
+    grandTotal: Number
+
+
+class ReportData(TypedDict, total=False):
+    result: Optional[List[Account]]
+    branch: Optional[List[BranchTotal]]
+    total: Optional[Totals]
+
+
+class ReportRequestBody(TypedDict, total=False):
+    # Validated by the ReportRequest model afterwards
+    start_date: Any
+    end_date: Any
+    banks_per_sheet: Any
+    format: Any
+    reportdata: Optional[ReportData]
+
+
+class DecodeError(ValueError):
+    """Raised when a body is not JSON or does not match the schema"""
+
+
+class UnsupportedBody(Exception):
+    """Raised for a Content-Encoding or Content-Type this server cannot read"""
+
+
+class BodyTooLarge(Exception):
+    """Raised when a decompressed body goes past the size limit"""
+
+
+if msgspec is not None:
+    _request_decoder = msgspec.json.Decoder(ReportRequestBody)
+    _msgpack_request_decoder = msgspec.msgpack.Decoder(ReportRequestBody)
+    _encoder = msgspec.json.Encoder(decimal_format="number")
+
+def fast_codec_available():
+    return msgspec is not None
+
+def media_type(content_type):
+    """Media type of a Content-Type header without its parameters, JSON when there is none"""
+    return (content_type or "application/json").split(";")[0].strip().lower()
+
+def msgpack_available():
+    return msgspec is not None or msgpack is not None
+
+def body_decompressor(content_encoding):
+    """Incremental decompressor for a Content-Encoding header, None when the body is not compressed"""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return None
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise UnsupportedBody(f"Unsupported Content-Encoding {content_encoding}")
+
+async def decode_body(chunks, content_encoding, max_bytes):
+    """Decompress an async iterator of body chunks as they arrive, at most max_bytes in all
+
+    Output is produced a bounded piece at a time and counted before the next piece, so a
+    small compressed body cannot inflate past max_bytes in memory.
+    """
+    decompressor = body_decompressor(content_encoding)
+    size = 0
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            pieces = [chunk] if decompressor is None else _decompress(decompressor, chunk)
+            for piece in pieces:
+                size += len(piece)
+                if size > max_bytes:
+                    raise BodyTooLarge(f"Body is larger than {max_bytes} bytes")
+                yield piece
+        if decompressor is not None:
+            piece = decompressor.flush()
+            size += len(piece)
+            if size > max_bytes:
+                raise BodyTooLarge(f"Body is larger than {max_bytes} bytes")
+            yield piece
+            if not getattr(decompressor, "eof", True):
+                raise DecodeError(f"Truncated {content_encoding} body")
+    except _DECOMPRESS_ERRORS as e:
+        raise DecodeError(f"Invalid {content_encoding} body: {str(e)}")
+
+def _decompress(decompressor, data):
+    """Yield the decompressed output of data in bounded pieces"""
+    if isinstance(decompressor, _ZLIB_DECOMPRESS):
+        # zlib stops at max_length and keeps the rest of the input in unconsumed_tail
+        while True:
+            piece = decompressor.decompress(data, DECOMPRESS_CHUNK)
+            data = decompressor.unconsumed_tail
+            yield piece
+            if not data and len(piece) < DECOMPRESS_CHUNK:
+                return
+    # zstandard's decompressobj has no output limit and its readers do not report a
+    # truncated frame, so it is fed slices small enough to bound their output
+    for start in range(0, len(data), _ZSTD_SLICE):
+        yield decompressor.decompress(data[start:start + _ZSTD_SLICE])
+
+def decode_report_request(body: bytes, content_type: str = None) -> dict:
+    """A /generate-excel body as a dict, its reportdata checked against the schema when msgspec is installed
+
+    The body is JSON, or MessagePack when content_type is one of MSGPACK_TYPES.
+    """
+    is_msgpack = media_type(content_type) in MSGPACK_TYPES
+    if is_msgpack and not msgpack_available():
+        raise UnsupportedBody("MessagePack bodies are not supported on this server")
+    if msgspec is not None:
+        try:
+            return (_msgpack_request_decoder if is_msgpack else _request_decoder).decode(body)
+        except msgspec.DecodeError as e:
+            raise DecodeError(str(e))
+    try:
+        data = msgpack.unpackb(body, raw=False) if is_msgpack else json.loads(body)
+    except ValueError as e:
+        raise DecodeError(str(e))
+    if not isinstance(data, dict):
+        raise DecodeError("Expected an object")
+    if not isinstance(data.get("reportdata") or {}, dict):
+        raise DecodeError("Expected `object | null` - at `$.reportdata`")
+    return data
+
+def encode(content) -> bytes:
+    """JSON bytes of a response body; Decimals, such as balances, are written as numbers"""
+    if msgspec is not None:
+        return _encoder.encode(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                      default=_encode_default).encode("utf-8")
+
+def _encode_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,101 @@
+from array import array
+
+from config import logger
+from task_dates import convert_task_dates
+
+
+class BankColumns:
+    """One bank of the reportdata payload with its tasks held as parallel columns
+
+    Row i of every column is task i. dates[i] is None for a task that could not be
+    read; renderers leave that row out, as they did when the task raised mid-row.
+    """
+
+    __slots__ = ("name", "account_no", "total_amount", "dates", "times", "codes",
+                 "withdraw", "amounts", "names", "payees", "admins")
+
+    def __init__(self, account):
+        self.name = account.get("name", "") or ""
+        account_no = account.get("accountNo", "") or ""
+        self.account_no = str(account_no) if isinstance(account_no, int) else account_no
+        self.total_amount = account.get("totalAmount", 0)
+
+        tasks = account.get("tasks", []) or []
+        self.dates, self.times = convert_task_dates([_get(task, "date") for task in tasks])
+        # Branch codes, admin names and dates repeat on almost every row, so keep one copy of each
+        intern = {}
+        self.codes = []
+        self.withdraw = array("b")
+        amounts = []
+        self.names = []
+        self.payees = []
+        self.admins = []
+        for position, task in enumerate(tasks):
+            try:
+                code, is_withdraw, amount, name, payee, admin = _read_task(task)
+            except Exception as e:
+                logger.error(f"Error processing transaction: {str(e)}")
+                self.dates[position] = None
+                code, is_withdraw, amount, name, payee, admin = "", False, None, "", "", ""
+            self.codes.append(intern.setdefault(code, code) if isinstance(code, str) else code)
+            self.withdraw.append(is_withdraw)
+            amounts.append(amount)
+            self.names.append(name)
+            self.payees.append(payee)
+            self.admins.append(intern.setdefault(admin, admin) if isinstance(admin, str) else admin)
+        for position, date_str in enumerate(self.dates):
+            if date_str:
+                self.dates[position] = intern.setdefault(date_str, date_str)
+        self.amounts = _amount_column(amounts)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def label(self, position):
+        """Name column of report2: the payee for a withdrawal, the customer otherwise"""
+        value = self.payees[position] if self.withdraw[position] else self.names[position]
+        return value if value else ""
+
+
+def normalize_reportdata(reportdata):
+    """Banks of a reportdata payload as BankColumns, in payload order"""
+    return list(iter_bank_columns(reportdata))
+
+def iter_bank_columns(reportdata):
+    """normalize_reportdata one bank at a time; banks that already are BankColumns pass through"""
+    accounts = reportdata.get("result", []) if reportdata else []
+    for account in accounts:
+        yield account if isinstance(account, BankColumns) else BankColumns(account)
+
+def _get(task, key):
+    return task.get(key) if isinstance(task, dict) else None
+
+def _read_task(task):
+    """(code, is_withdraw, amount, name, payee, admin) of one task dict"""
+    branch_info = task.get("branchs") or {}
+    code = branch_info.get("code", "")
+    is_withdraw = task.get("type") == "WITHDRAW"
+    payee = ""
+    if is_withdraw:
+        adminbank = task.get("bank2") or {}
+        payee = adminbank.get("name", "")
+        if payee is None:
+            payee = (task.get("WithdrawBank") or {}).get("bankAccountName", "")
+    name = task.get("name", "") or ""
+    admin = (task.get("users") or {}).get("name", "")
+    return code, is_withdraw, task.get("amount"), name, payee, admin
+
+def _amount_column(amounts):
+    """Amounts as an int or float array when they are all of one plain type, else the list as given
+
+    Ints stay ints so the renderers write 100, not 100.0, exactly as the payload had it.
+    """
+    types = {type(amount) for amount in amounts}
+    if types == {int}:
+        try:
+            return array("q", amounts)
+        except OverflowError:
+            return amounts
+    if types == {float}:
+        return array("d", amounts)
+    return amounts
@@ -0,0 +1,91 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from config import logger, REPORT_WORKERS, REPORT_QUEUE_LIMIT
+
+
+class ReportQueueFull(Exception):
+    """Raised when every worker is busy and the queue is at its limit"""
+
+
+class ReportExecutor:
+    """Process pool for report rendering, so CPU-bound work stays out of the API process"""
+
+    def __init__(self, max_workers=REPORT_WORKERS, queue_limit=REPORT_QUEUE_LIMIT):
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Jobs running or waiting for a worker"""
+        return self._pending
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn on a worker process, raising ReportQueueFull when there is no room
+
+        A pool whose worker died, such as one killed for running out of memory, is dropped and
+        replaced by a new one. Raises BrokenProcessPool if the new pool cannot take fn either.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.queue_limit:
+                raise ReportQueueFull(f"{self._pending} reports already queued or running")
+            self._pending += 1
+        pool = self._get_pool()
+        try:
+            try:
+                future = pool.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                # A worker died and the pool's callbacks have not dropped it yet
+                self._discard(pool)
+                pool = self._get_pool()
+                future = pool.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._release(pool, None)
+            self._discard(pool)
+            raise
+        except Exception:
+            self._release(pool, None)
+            raise
+        future.add_done_callback(partial(self._release, pool))
+        return future
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn, because forking the API process would copy its threads and DB connections
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _release(self, pool, future):
+        with self._lock:
+            self._pending -= 1
+        if future is None or future.cancelled() or future.exception() is None:
+            return
+        logger.error(f"Report worker failed: {str(future.exception())}")
+        if isinstance(future.exception(), BrokenProcessPool):
+            self._discard(pool)
+
+    def _discard(self, pool):
+        """Drop a pool whose worker died, so the next submit starts a new one"""
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        logger.warning("Report worker pool is broken, starting a new one for the next report")
+        pool.shutdown(wait=False)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+
+report_executor = ReportExecutor()
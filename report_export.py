@@ -0,0 +1,139 @@
+import csv
+import io
+import os
+
+from config import logger, REPORTS_DIR
+from report_metrics import ReportMetrics
+from report_columns import iter_bank_columns
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional, CSV needs nothing extra
+    pyarrow = None
+
+# Flat long format for machine consumers: one row per task, banks in payload order
+EXPORT_COLUMNS = ["bank", "accountNo", "date", "time", "branch", "name", "withdraw", "deposit", "approver"]
+EXPORT_FORMATS = ("csv", "parquet")
+
+
+def parquet_available():
+    return pyarrow is not None
+
+def iter_bank_rows(account):
+    """Export rows of one BankColumns, leaving out tasks that could not be read"""
+    for position in range(len(account)):
+        date_str = account.dates[position]
+        if date_str is None:
+            continue
+        amount = account.amounts[position]
+        is_withdraw = account.withdraw[position]
+        yield [account.name, account.account_no, date_str, account.times[position],
+               account.codes[position], account.label(position),
+               amount if is_withdraw else None, None if is_withdraw else amount,
+               account.admins[position]]
+
+def create_report_export(report_id: str, date_range=None, reportdata: dict = None, format: str = "csv",
+                         metrics: ReportMetrics = None):
+    """Write the tasks of a reportdata payload to REPORTS_DIR as a CSV or Parquet table"""
+    try:
+        logger.info(f"Starting {format} export for report_id: {report_id}")
+
+        filename = f"financial_report_{report_id}.{format}"
+        filepath = os.path.join(REPORTS_DIR, filename)
+
+        write_export(filepath, reportdata, format, metrics)
+
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Failed to create file at {filepath}")
+
+        os.chmod(filepath, 0o666)
+
+        return filename
+
+    except Exception as e:
+        logger.error(f"Error generating {format} export: {str(e)}")
+        raise
+
+def render_export_bytes(reportdata: dict = None, format: str = "csv"):
+    """create_report_export in memory, for exports small enough to return in one response"""
+    buffer = io.BytesIO()
+    write_export(buffer, reportdata, format)
+    return buffer.getvalue()
+
+def write_export(output, reportdata: dict, format: str, metrics: ReportMetrics = None):
+    """Write the export to a path or a binary file object, one bank at a time
+
+    reportdata["result"] may be an iterator, each bank is read from it as it is written.
+    """
+    if metrics is None:
+        metrics = ReportMetrics()
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {format}")
+    if format == "parquet" and pyarrow is None:
+        raise ValueError("Parquet export needs pyarrow installed")
+    accounts = iter_bank_columns(reportdata)
+
+    if format == "csv":
+        bank_count = _write_csv(output, accounts, metrics)
+    else:
+        bank_count = _write_parquet(output, accounts, metrics)
+    if not bank_count:
+        raise ValueError("No accounts found")
+    metrics.lap("save")
+
+def _write_csv(output, accounts, metrics):
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, "w", newline="", encoding="utf-8") as f:
+            return _write_csv_rows(f, accounts, metrics)
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    bank_count = _write_csv_rows(text, accounts, metrics)
+    # Leave the caller's file object open
+    text.flush()
+    text.detach()
+    return bank_count
+
+def _write_csv_rows(f, accounts, metrics):
+    """Write the header and every bank's rows, returning the number of banks"""
+    writer = csv.writer(f)
+    writer.writerow(EXPORT_COLUMNS)
+    bank_count = 0
+    for account in accounts:
+        rows = list(iter_bank_rows(account))
+        writer.writerows(rows)
+        metrics.count("rows", len(rows))
+        bank_count += 1
+    metrics.lap("banks")
+    return bank_count
+
+def _write_parquet(output, accounts, metrics):
+    schema = pyarrow.schema([
+        ("bank", pyarrow.string()),
+        ("accountNo", pyarrow.string()),
+        ("date", pyarrow.string()),
+        ("time", pyarrow.string()),
+        ("branch", pyarrow.string()),
+        ("name", pyarrow.string()),
+        ("withdraw", pyarrow.float64()),
+        ("deposit", pyarrow.float64()),
+        ("approver", pyarrow.string()),
+    ])
+    # One row group per bank, so only one bank's rows are held as Arrow arrays at a time
+    bank_count = 0
+    with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+        for account in accounts:
+            bank_count += 1
+            rows = list(iter_bank_rows(account))
+            if not rows:
+                continue
+            columns = [_parquet_column(values, field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+            metrics.count("rows", len(rows))
+    metrics.lap("banks")
+    return bank_count
+
+def _parquet_column(values, type_):
+    """Column values as the column type: amounts as floats, everything else as text"""
+    if type_ == pyarrow.float64():
+        return [None if value is None or value == "" else float(value) for value in values]
+    return [value if value is None or isinstance(value, str) else str(value) for value in values]
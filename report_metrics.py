@@ -0,0 +1,96 @@
+import threading
+import time
+
+PHASES = ["parse", "layout", "banks", "summary", "branches", "save"]
+COUNTERS = ["rows", "cells", "styles"]
+
+
+class ReportMetrics:
+    """Phase timings and counters for one report"""
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self._last = time.perf_counter()
+
+    def lap(self, name):
+        """Charge the time since the previous lap to a phase"""
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def as_dict(self):
+        return {
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "counters": dict(self.counters),
+        }
+
+
+# Totals across finished jobs, kept by the API process for /metrics
+_lock = threading.Lock()
+_phase_seconds = {}
+_counter_totals = {}
+_jobs = {}
+_evicted_files = {}
+_evicted_bytes = {}
+
+def record_job(state, metrics=None):
+    """Add a finished job, and its metrics dict if it has one, to the totals"""
+    with _lock:
+        _jobs[state] = _jobs.get(state, 0) + 1
+        if not metrics:
+            return
+        for name, seconds in metrics.get("phases", {}).items():
+            _phase_seconds[name] = _phase_seconds.get(name, 0.0) + seconds
+        for name, value in metrics.get("counters", {}).items():
+            _counter_totals[name] = _counter_totals.get(name, 0) + value
+
+def record_eviction(reason, size):
+    """Add a report file removed by retention, for reason "age", "size" or "orphan", to the totals"""
+    with _lock:
+        _evicted_files[reason] = _evicted_files.get(reason, 0) + 1
+        _evicted_bytes[reason] = _evicted_bytes.get(reason, 0) + size
+
+def render_prometheus(gauges=None):
+    """Totals in the Prometheus text exposition format, plus optional {name: (help, value)} gauges"""
+    with _lock:
+        phase_seconds = dict(_phase_seconds)
+        counter_totals = dict(_counter_totals)
+        jobs = dict(_jobs)
+        evicted_files = dict(_evicted_files)
+        evicted_bytes = dict(_evicted_bytes)
+
+    lines = [
+        "# HELP report_phase_seconds_total Time spent in each report generation phase.",
+        "# TYPE report_phase_seconds_total counter",
+    ]
+    for name in PHASES + sorted(set(phase_seconds) - set(PHASES)):
+        lines.append(f'report_phase_seconds_total{{phase="{name}"}} {phase_seconds.get(name, 0.0)}')
+
+    for name in COUNTERS + sorted(set(counter_totals) - set(COUNTERS)):
+        lines.append(f"# HELP report_{name}_total Report {name} written.")
+        lines.append(f"# TYPE report_{name}_total counter")
+        lines.append(f"report_{name}_total {counter_totals.get(name, 0)}")
+
+    lines.append("# HELP report_jobs_total Report jobs finished, by final state.")
+    lines.append("# TYPE report_jobs_total counter")
+    for state in sorted(jobs):
+        lines.append(f'report_jobs_total{{state="{state}"}} {jobs[state]}')
+
+    lines.append("# HELP report_evicted_files_total Report files removed by retention, by reason.")
+    lines.append("# TYPE report_evicted_files_total counter")
+    for reason in sorted(evicted_files):
+        lines.append(f'report_evicted_files_total{{reason="{reason}"}} {evicted_files[reason]}')
+    lines.append("# HELP report_evicted_bytes_total Bytes of report files removed by retention, by reason.")
+    lines.append("# TYPE report_evicted_bytes_total counter")
+    for reason in sorted(evicted_bytes):
+        lines.append(f'report_evicted_bytes_total{{reason="{reason}"}} {evicted_bytes[reason]}')
+
+    for name, (help_text, value) in (gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
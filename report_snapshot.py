@@ -0,0 +1,134 @@
+import glob
+import hashlib
+import os
+import pickle
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from operator import attrgetter
+
+from config import logger, SNAPSHOT_DIR, SNAPSHOT_OVERLAP_SECONDS, SNAPSHOT_REBUILD_SECONDS
+from data_service import iter_changed_transactions
+
+PENDING_STATUSES = ("PENDING", "ADMIN_PENDING")
+
+# The columns _add_transactions reads, picklable unlike SQLAlchemy rows
+SnapshotTask = namedtuple("SnapshotTask", ["id", "bankId", "amount", "type", "name", "status",
+                                           "updatedAt", "reason", "code", "bankAccountName"])
+
+
+class ReportSnapshot:
+    """Transactions of one date range kept between incremental runs, by bank and task id"""
+
+    def __init__(self, date_range):
+        self.date_range = tuple(date_range)
+        self.bounds = tuple(datetime.strptime(value, "%Y-%m-%d %H:%M:%S") for value in date_range)
+        self.banks = {}
+        self.bank_of = {}
+        # (updatedAt, id) of the newest task seen, the next refresh starts from there
+        self.watermark = None
+        # When the full query ran; refresh_snapshot starts over once this is too old
+        self.built_at = datetime.now()
+
+    def matches(self, task):
+        """Same filter as the report query: updated in the range, or still pending"""
+        start_date, end_date = self.bounds
+        if (task.status or "").upper() in PENDING_STATUSES:
+            return True
+        return task.updatedAt is not None and start_date <= task.updatedAt <= end_date
+
+    def apply(self, rows):
+        """Insert, move or drop each changed task and return how many there were
+
+        Soft deleted tasks are dropped like tasks that left the date range.
+        """
+        changed = 0
+        for row in rows:
+            task = SnapshotTask(*(getattr(row, field) for field in SnapshotTask._fields))
+            changed += 1
+            # A task may have moved bank or left the range since it was stored
+            old_bank = self.bank_of.pop(task.id, None)
+            if old_bank is not None:
+                del self.banks[old_bank][task.id]
+            if not row.isDelete and self.matches(task):
+                self.banks.setdefault(task.bankId, {})[task.id] = task
+                self.bank_of[task.id] = task.bankId
+            if task.updatedAt is not None and (self.watermark is None or (task.updatedAt, task.id) > self.watermark):
+                self.watermark = (task.updatedAt, task.id)
+        return changed
+
+    def iter_banks(self):
+        """Yield (bankId, transactions) newest first, like iter_transactions_by_bank"""
+        for bank_id in sorted(self.banks):
+            tasks = self.banks[bank_id]
+            if tasks:
+                yield bank_id, sorted(tasks.values(), key=attrgetter("updatedAt", "id"), reverse=True)
+
+
+def _needs_rebuild(snapshot):
+    """Whether a snapshot may hold tasks hard deleted since its full query ran"""
+    built_at = getattr(snapshot, "built_at", None)
+    return built_at is None or datetime.now() - built_at > timedelta(seconds=SNAPSHOT_REBUILD_SECONDS)
+
+def _snapshot_path(date_range):
+    key = hashlib.sha256("|".join(date_range).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(SNAPSHOT_DIR, f"{key}.pickle")
+
+def load_snapshot(date_range):
+    """Stored snapshot for a date range, or None when there is none or it cannot be read"""
+    path = _snapshot_path(date_range)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Discarding unreadable report snapshot {path}: {str(e)}")
+        return None
+    return snapshot if snapshot.date_range == tuple(date_range) else None
+
+def save_snapshot(snapshot):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = _snapshot_path(snapshot.date_range)
+    # Write then rename, so a concurrent run never reads half a snapshot
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def refresh_snapshot(date_range):
+    """Bring the date range's snapshot up to date, fetching only tasks updated since the last run"""
+    snapshot = load_snapshot(date_range)
+    if snapshot is None or _needs_rebuild(snapshot):
+        snapshot = ReportSnapshot(date_range)
+        since = None
+    elif snapshot.watermark is None:
+        since = None
+    else:
+        since = snapshot.watermark[0] - timedelta(seconds=SNAPSHOT_OVERLAP_SECONDS)
+
+    changed = snapshot.apply(iter_changed_transactions(date_range, since))
+    save_snapshot(snapshot)
+    logger.info(f"Report snapshot for {date_range}: {changed} changed tasks, "
+                f"{len(snapshot.bank_of)} in report")
+    return snapshot
+
+def expire_snapshots(max_age=SNAPSHOT_REBUILD_SECONDS):
+    """Remove snapshots, and temporary files of interrupted saves, not written for max_age seconds
+
+    A snapshot that old would be rebuilt from scratch on its next use anyway.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in glob.glob(os.path.join(SNAPSHOT_DIR, "*.pickle*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error removing report snapshot {path}: {str(e)}")
+    if removed:
+        logger.info(f"Removed {removed} expired report snapshots")
+    return removed
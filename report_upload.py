@@ -0,0 +1,117 @@
+import hashlib
+import os
+import tempfile
+
+import ijson
+
+from config import logger, UPLOAD_DIR
+from report_codec import msgpack
+from report_metrics import ReportMetrics
+from report_columns import BankColumns
+from excel_service2 import create_excel_report2
+from report_export import create_report_export
+
+# Parts of a reportdata document built as Python values, everything else is skipped
+_BUILT = ("result.item", "branch", "total")
+
+
+def msgpack_uploads_available():
+    """MessagePack uploads are read one bank at a time with msgpack's Unpacker"""
+    return msgpack is not None
+
+async def spool_upload(chunks, suffix=".json"):
+    """Write an async iterator of body chunks to a file in UPLOAD_DIR, returning (path, sha256)
+
+    Only one chunk is held in memory at a time. The file is removed if the upload fails.
+    suffix names the encoding, .json or .msgpack.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=UPLOAD_DIR)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+def iter_reportdata(f):
+    """Yield (part, value) from a reportdata JSON file in one incremental pass
+
+    part is "result.item" for each bank, then "branch" or "total", in document order.
+    Only one bank's dicts exist at a time, whatever the size of the file.
+    """
+    builder = None
+    for prefix, event, value in ijson.parse(f, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == part and event in ("end_map", "end_array"):
+                yield part, builder.value
+                builder = None
+        elif prefix in _BUILT:
+            if event in ("start_map", "start_array"):
+                part = prefix
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif event not in ("map_key", "end_map", "end_array"):
+                yield prefix, value
+
+def iter_msgpack_reportdata(f):
+    """iter_reportdata for a MessagePack file, unpacking one bank at a time"""
+    unpacker = msgpack.Unpacker(f, raw=False)
+    for _ in range(unpacker.read_map_header()):
+        key = unpacker.unpack()
+        if key == "result":
+            try:
+                bank_count = unpacker.read_array_header()
+            except ValueError:
+                # Not an array, such as nil: no banks
+                unpacker.skip()
+                continue
+            for _ in range(bank_count):
+                yield "result.item", unpacker.unpack()
+        elif key in ("branch", "total"):
+            yield key, unpacker.unpack()
+        else:
+            unpacker.skip()
+
+def _iter_upload(f, path):
+    return iter_msgpack_reportdata(f) if path.endswith(".msgpack") else iter_reportdata(f)
+
+def iter_upload_banks(path):
+    """Banks of an uploaded reportdata file as BankColumns, parsed as they are read"""
+    with open(path, "rb") as f:
+        for part, value in _iter_upload(f, path):
+            if part == "result.item":
+                yield BankColumns(value or {})
+
+def load_upload(path):
+    """Uploaded reportdata with its banks as BankColumns, never holding the whole document as dicts"""
+    reportdata = {"result": []}
+    with open(path, "rb") as f:
+        for part, value in _iter_upload(f, path):
+            if part == "result.item":
+                reportdata["result"].append(BankColumns(value or {}))
+            else:
+                reportdata[part] = value
+    return reportdata
+
+def create_report_from_upload(report_id: str, date_range, path, format: str = "xlsx", banks_per_sheet: int = None,
+                              metrics: ReportMetrics = None):
+    """Render a report from an uploaded reportdata file, then remove the file"""
+    try:
+        logger.info(f"Reading uploaded reportdata for report_id: {report_id}")
+        if format == "xlsx":
+            return create_excel_report2(report_id, date_range, reportdata=load_upload(path), write_only=True,
+                                        metrics=metrics, banks_per_sheet=banks_per_sheet)
+        # The flat formats write each bank as soon as it is parsed
+        return create_report_export(report_id, date_range, reportdata={"result": iter_upload_banks(path)},
+                                    format=format, metrics=metrics)
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,101 @@
+from openpyxl.styles import NamedStyle, PatternFill, Border, Side, Alignment, Font
+from openpyxl.styles.borders import DEFAULT_BORDER
+from openpyxl.styles.fonts import DEFAULT_FONT
+
+from config import color_code_mapping
+
+DEFAULT_COLOR = "FFFFFFFF"
+
+thin_side = Side(style='thin')
+thin_border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
+
+_fills = {}
+
+def solid_fill(color):
+    """Shared solid PatternFill for a color"""
+    fill = _fills.get(color)
+    if fill is None:
+        fill = _fills[color] = PatternFill(start_color=color, end_color=color, fill_type="solid")
+    return fill
+
+# Fixed report styles: name -> (fill, border, font, alignment)
+REPORT_STYLES = {
+    "top_total": (solid_fill("FFB6D7E8"), thin_border, None, None),
+    "title": (solid_fill("FFFFD9D9"), None, None, Alignment(horizontal='center')),
+    "bank_header": (None, thin_border, Font(bold=True), Alignment(horizontal='center')),
+    "bank_header_merged": (None, Border(top=thin_side, bottom=thin_side), None, None),
+    "bank_header_merged_end": (None, Border(top=thin_side, bottom=thin_side, right=thin_side), None, None),
+    "baseline": (solid_fill("FFB6D7E8"), None, None, None),
+    "column_header": (None, thin_border, Font(bold=True), None),
+    "bank_name": (solid_fill("FFFFC080"), thin_border, None, None),
+    "bank_amount": (solid_fill("FFFFC0C0"), thin_border, None, None),
+    "centered": (None, None, None, Alignment(horizontal='center')),
+    "bordered": (None, thin_border, None, None),
+    "cash_label": (solid_fill("FFDCE6F1"), thin_border, None, Alignment(horizontal='center')),
+    "cash_value": (solid_fill("FFFFFF66"), thin_border, None, None),
+    "summary_label": (solid_fill("FFC5D9F1"), thin_border, None, None),
+    "summary_value": (solid_fill("FFDCE6F1"), thin_border, None, None),
+    "claimed_label": (solid_fill("FFFFFFCC"), thin_border, None, None),
+    "claimed_value": (PatternFill(start_color="FFFFCC", end_color="FFFFFFCC", fill_type="solid"), thin_border, None, None),
+}
+
+def _branch_style(color, wrap_text):
+    """Fill, border and alignment of a branch colored cell"""
+    alignment = Alignment(wrap_text=True) if wrap_text else None
+    return (solid_fill(color), thin_border, None, alignment)
+
+class StyleRegistry:
+    """Named styles registered once per workbook, so each cell gets one style assignment"""
+
+    def __init__(self, wb):
+        self.wb = wb
+        self._registered = set(wb.named_styles)
+
+    @property
+    def count(self):
+        """Named styles in the workbook"""
+        return len(self._registered)
+
+    def get(self, name):
+        """Name of a fixed report style, registered on first use"""
+        if name not in self._registered:
+            self._register(name, REPORT_STYLES[name])
+        return name
+
+    def branch(self, code, wrap_text=False):
+        """Name of the style for a branch code, one per color in color_code_mapping"""
+        color = color_code_mapping.get(code, DEFAULT_COLOR) if code is not None else DEFAULT_COLOR
+        return self._branch_color(color, wrap_text)
+
+    def register_all(self):
+        """Register every fixed and branch style in a fixed order, each with its cell style id
+
+        Workbooks that start with this number their styles alike, so sheets rendered in
+        separate workbooks can share one styles.xml.
+        """
+        names = [self.get(name) for name in REPORT_STYLES]
+        for color in sorted(set(color_code_mapping.values()) | {DEFAULT_COLOR}):
+            names.append(self._branch_color(color, False))
+            names.append(self._branch_color(color, True))
+        for name in names:
+            self.wb._cell_styles.add(self.wb._named_styles[name].as_tuple())
+
+    def _branch_color(self, color, wrap_text):
+        name = f"branch_{color}_wrap" if wrap_text else f"branch_{color}"
+        if name not in self._registered:
+            self._register(name, _branch_style(color, wrap_text))
+        return name
+
+    def _register(self, name, spec):
+        fill, border, font, alignment = spec
+        style = NamedStyle(name=name, font=DEFAULT_FONT, border=DEFAULT_BORDER)
+        if fill is not None:
+            style.fill = fill
+        if border is not None:
+            style.border = border
+        if font is not None:
+            style.font = font
+        if alignment is not None:
+            style.alignment = alignment
+        self.wb.add_named_style(style)
+        self._registered.add(name)
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from config import logger
+
+# Asia/Kuala_Lumpur has been UTC+08:00 with no DST since 1982, so a fixed offset
+# gives the same wall clock as malaysia_tz for every task date
+MALAYSIA_OFFSET = timedelta(hours=8)
+
+
+def convert_task_dates(values):
+    """Date ('%d-%m-%Y') and time ('%H:%M:%S') strings in Malaysia time for a bank's task dates
+
+    values may be ISO 8601 strings from the reportdata payload or datetimes from the
+    database; naive datetimes are UTC. Empty values give '' and unparseable or non-string
+    ones None, so callers can skip that row as before.
+    """
+    dates = []
+    times = []
+    for value in values:
+        if not value:
+            dates.append('')
+            times.append('')
+            continue
+        try:
+            dt = value if isinstance(value, datetime) else datetime.fromisoformat(value.replace("Z", "+00:00"))
+            offset = dt.utcoffset()
+            local = dt.replace(tzinfo=None) + MALAYSIA_OFFSET
+            if offset:
+                local -= offset
+        except (AttributeError, TypeError, ValueError) as e:
+            # AttributeError: a non-string value such as an epoch timestamp
+            logger.error(f"Invalid task date {value!r}: {str(e)}")
+            dates.append(None)
+            times.append(None)
+            continue
+        dates.append(f"{local.day:02d}-{local.month:02d}-{local.year:04d}")
+        times.append(f"{local.hour:02d}:{local.minute:02d}:{local.second:02d}")
+    return dates, times
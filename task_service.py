@@ -1,25 +1,74 @@
 # task_service.py
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from config import engine
+from balance_ledger import record_deltas, task_amount, task_delta
 
 def create_task(task_data):
+    validate_task(task_data)
     with engine.begin() as conn: 
-        bank_id = task_data["bankId"]
-        amount = task_data["amount"]
-        task_type = task_data["type"]
-
-        if task_type == "WITHDRAW":
-            conn.execute(
-                text("UPDATE Bank SET balance = balance - :amount WHERE id = :bank_id"),
-                {"amount": amount, "bank_id": bank_id}
-            )
-        elif task_type == "DEPOSIT":
-            conn.execute(
-                text("UPDATE Bank SET balance = balance + :amount WHERE id = :bank_id"),
-                {"amount": amount, "bank_id": bank_id}
-            )
+        # The balance change goes to the ledger instead of locking the Bank row
+        record_deltas(conn, [task_data])
 
         conn.execute(text("""
             INSERT INTO Task (id, bankId, amount, type, status, updatedAt)
             VALUES (:id, :bankId, :amount, :type, :status, NOW())
         """), task_data)
+
+TASK_FIELDS = ("id", "bankId", "amount", "type", "status")
+TASK_TYPES = ("WITHDRAW", "DEPOSIT")
+INSERT_BATCH_SIZE = 500
+
+def validate_task(task_data, label="Task"):
+    """Raise ValueError unless a task has every field, a known type and a numeric amount"""
+    missing = [field for field in TASK_FIELDS if task_data.get(field) is None]
+    if missing:
+        raise ValueError(f"{label} is missing {', '.join(missing)}")
+    if task_data["type"] not in TASK_TYPES:
+        raise ValueError(f"{label} has unknown type {task_data['type']!r}")
+    try:
+        task_amount(task_data["amount"])
+    except ValueError as e:
+        raise ValueError(f"{label}: {str(e)}")
+
+def balance_deltas(batch):
+    """Net balance change per bankId of a batch"""
+    deltas = {}
+    for task_data in batch:
+        delta = task_delta(task_data)
+        if delta:
+            deltas[task_data["bankId"]] = deltas.get(task_data["bankId"], 0) + delta
+    return deltas
+
+def create_tasks(batch):
+    """Insert a batch of tasks and their balance ledger rows in one transaction
+
+    All or nothing: a missing field, a non numeric amount, an unknown type, a duplicate id,
+    an unknown bankId or any database error rolls back every ledger row and insert of the batch.
+    Returns {"created": count, "balances": {bankId: net change}}.
+    """
+    for position, task_data in enumerate(batch):
+        validate_task(task_data, f"Task {position}")
+    ids = [task_data["id"] for task_data in batch]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Duplicate task id in batch")
+
+    deltas = balance_deltas(batch)
+    rows = [{field: task_data[field] for field in TASK_FIELDS} for task_data in batch]
+    bank_ids = sorted({task_data["bankId"] for task_data in batch})
+    with engine.begin() as conn:
+        known = conn.execute(text("SELECT COUNT(*) FROM Bank WHERE id IN :bank_ids")
+                             .bindparams(bindparam("bank_ids", expanding=True)),
+                             {"bank_ids": bank_ids}).scalar()
+        if known != len(bank_ids):
+            raise ValueError("Unknown bankId in batch")
+
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            chunk = rows[start:start + INSERT_BATCH_SIZE]
+            # Balance changes go to the ledger, one row per task, instead of locking Bank rows
+            record_deltas(conn, chunk)
+            conn.execute(text("""
+                INSERT INTO Task (id, bankId, amount, type, status, updatedAt)
+                VALUES (:id, :bankId, :amount, :type, :status, NOW())
+            """), chunk)
+
+    return {"created": len(rows), "balances": deltas}
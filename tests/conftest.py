@@ -0,0 +1,44 @@
+import sqlite3
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+import balance_ledger
+import data_service
+import task_service
+
+BANK_IDS = (1, 2, 3)
+
+
+@pytest.fixture
+def ledger_engine(tmp_path, monkeypatch):
+    """The task and ledger writers pointed at a SQLite stand-in of Bank, Task and BankBalanceDelta"""
+    # sqlite3 cannot bind Decimal; store it as text like the MySQL driver sends it
+    monkeypatch.setitem(sqlite3.adapters, (Decimal, sqlite3.PrepareProtocol), str)
+    engine = create_engine(f"sqlite:///{tmp_path / 'ledger.sqlite3'}")
+
+    @event.listens_for(engine, "connect")
+    def add_now(dbapi_connection, connection_record):
+        dbapi_connection.create_function("NOW", 0, lambda: datetime.now().isoformat(" "))
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE Bank (id INTEGER PRIMARY KEY, name TEXT, balance NUMERIC NOT NULL DEFAULT 0)"))
+        conn.execute(text("""
+            CREATE TABLE Task (
+                id TEXT PRIMARY KEY, bankId INTEGER, amount NUMERIC, type TEXT, status TEXT, updatedAt TIMESTAMP
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE BankBalanceDelta (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, bankId INTEGER NOT NULL, taskId TEXT,
+                amount NUMERIC NOT NULL, createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        conn.execute(text("INSERT INTO Bank (id, name) VALUES (:id, :name)"),
+                     [{"id": bank_id, "name": f"BANK {bank_id}"} for bank_id in BANK_IDS])
+    for module in (task_service, data_service, balance_ledger):
+        monkeypatch.setattr(module, "engine", engine)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,71 @@
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+import async_data_service
+import data_service
+from benchmark import DATE_RANGE, make_reportdata, make_sqlite_db
+
+NEXT_DAY = ("2025-02-12 00:00:00", "2025-02-12 23:59:59")
+
+
+@pytest.fixture
+def reportdata():
+    return make_reportdata(banks=3, tasks_per_bank=25, branch_codes=["A385", "B01", "K01"], seed=7)
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch, reportdata):
+    """Both data layers pointed at a SQLite stand-in of the production schema"""
+    path = tmp_path / "report.sqlite3"
+    make_sqlite_db(reportdata, path)
+    engine = create_engine(f"sqlite:///{path}", connect_args={"detect_types": sqlite3.PARSE_DECLTYPES})
+    monkeypatch.setattr(data_service, "engine", engine)
+    monkeypatch.setattr(async_data_service, "ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{path}")
+    monkeypatch.setattr(async_data_service, "_engine", None)
+    yield path
+    engine.dispose()
+
+def _run(coroutine):
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await async_data_service.dispose_async_engine()
+    return asyncio.run(run())
+
+def _expected_totals(reportdata):
+    tasks = [task for account in reportdata["result"] for task in account["tasks"]]
+    return {
+        "pending_total": sum(task["amount"] for task in tasks if task["status"] == "PENDING"),
+        "complete_total": sum(task["amount"] if task["type"] == "DEPOSIT" else -task["amount"]
+                              for task in tasks if task["status"] == "COMPLETE"),
+        "grand_total": sum(task["amount"] for task in tasks),
+    }
+
+def test_get_total(sqlite_db, reportdata):
+    assert _run(async_data_service.get_total(DATE_RANGE)) == _expected_totals(reportdata)
+
+def test_get_total_outside_range_keeps_pending_only(sqlite_db, reportdata):
+    totals = _run(async_data_service.get_total(NEXT_DAY))
+    assert totals == {"pending_total": _expected_totals(reportdata)["pending_total"],
+                      "complete_total": 0, "grand_total": 0}
+
+@pytest.mark.parametrize("date_range", [DATE_RANGE, NEXT_DAY])
+def test_get_total_matches_sync(sqlite_db, date_range):
+    assert _run(async_data_service.get_total(date_range)) == data_service.get_total(date_range)
+
+def test_fetch_report_inputs(sqlite_db, reportdata):
+    accounts, totals, branches = _run(async_data_service.fetch_report_inputs(DATE_RANGE))
+    assert [tuple(row) for row in accounts] == [tuple(row) for row in data_service.get_accounts()]
+    assert [account.name for account in accounts] == sorted(account["name"] for account in reportdata["result"])
+    assert totals == data_service.get_total(DATE_RANGE)
+    assert [tuple(row) for row in branches] == [tuple(row) for row in data_service.get_branches(DATE_RANGE)]
+    assert sorted(branch.code for branch in branches) == ["A385", "B01", "K01"]
+
+def test_load_report_inputs_runs_on_fresh_event_loops(sqlite_db):
+    first = async_data_service.load_report_inputs(DATE_RANGE)
+    second = async_data_service.load_report_inputs(DATE_RANGE)
+    assert first[1] == second[1] == data_service.get_total(DATE_RANGE)
+    assert async_data_service._engine is None
@@ -0,0 +1,97 @@
+import threading
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+import balance_ledger
+from balance_ledger import compact, record_deltas, task_amount, task_delta
+from task_service import create_tasks
+
+
+def _task(task_id, bank_id, amount, type_="DEPOSIT"):
+    return {"id": task_id, "bankId": bank_id, "amount": amount, "type": type_, "status": "COMPLETE"}
+
+def _balances(engine):
+    with engine.connect() as conn:
+        return {row.id: Decimal(str(row.balance)) for row in conn.execute(text("SELECT id, balance FROM Bank"))}
+
+def _ledger_size(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM BankBalanceDelta")).scalar()
+
+def test_task_delta():
+    assert task_delta(_task("t", 1, 100)) == Decimal("100")
+    assert task_delta(_task("t", 1, "40.50", "WITHDRAW")) == Decimal("-40.50")
+    assert task_delta(_task("t", 1, 0.1)) == Decimal("0.1")
+    assert task_delta(_task("t", 1, 100, "ADJUST")) == 0
+
+@pytest.mark.parametrize("amount", ["12abc", "", None, "NaN", "Infinity", [1]])
+def test_task_amount_rejects_non_numbers(amount):
+    with pytest.raises(ValueError):
+        task_amount(amount)
+
+def test_record_deltas_skips_zero_amounts(ledger_engine):
+    with ledger_engine.begin() as conn:
+        assert record_deltas(conn, [_task("t1", 1, 100), _task("t2", 2, 0), _task("t3", 2, 5, "WITHDRAW")]) == 2
+    with ledger_engine.connect() as conn:
+        rows = conn.execute(text("SELECT bankId, taskId, amount FROM BankBalanceDelta ORDER BY id")).fetchall()
+    assert [(row.bankId, row.taskId, Decimal(str(row.amount))) for row in rows] == [(1, "t1", 100), (2, "t3", -5)]
+
+def test_compact_folds_deltas_into_bank_balance(ledger_engine):
+    create_tasks([_task("t1", 1, 100), _task("t2", 1, "40.50", "WITHDRAW"), _task("t3", 2, 7),
+                  _task("t4", 3, "2.25"), _task("t5", 2, 3, "WITHDRAW")])
+
+    assert compact(batch_size=2) == 2
+    assert _ledger_size(ledger_engine) == 3
+    assert _balances(ledger_engine) == {1: Decimal("59.5"), 2: 0, 3: 0}
+    while compact(batch_size=2):
+        pass
+
+    assert _ledger_size(ledger_engine) == 0
+    assert _balances(ledger_engine) == {1: Decimal("59.5"), 2: 4, 3: Decimal("2.25")}
+    assert compact() == 0
+
+def test_compact_keeps_deltas_added_while_it_runs(ledger_engine, monkeypatch):
+    create_tasks([_task("t1", 1, 100), _task("t2", 2, 50)])
+
+    # A task commits its delta after compact has chosen its ids
+    select = balance_ledger.select
+    def select_then_insert(*columns):
+        create_tasks([_task("late", 1, 5)])
+        return select(*columns)
+    monkeypatch.setattr(balance_ledger, "select", select_then_insert)
+    assert compact() == 2
+    monkeypatch.setattr(balance_ledger, "select", select)
+
+    assert _ledger_size(ledger_engine) == 1
+    assert compact() == 1
+    assert _balances(ledger_engine) == {1: 105, 2: 50, 3: 0}
+
+def test_concurrent_inserts_during_compaction(ledger_engine):
+    batches = [[_task(f"b{batch}t{number}", 1 + number % 3, number + 1, "WITHDRAW" if number % 4 == 0 else "DEPOSIT")
+                for number in range(20)] for batch in range(20)]
+    errors = []
+
+    def insert():
+        try:
+            for batch in batches:
+                create_tasks(batch)
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=insert)
+    writer.start()
+    while writer.is_alive():
+        compact(batch_size=7)
+    writer.join()
+    while compact(batch_size=7):
+        pass
+
+    assert not errors
+    expected = {1: Decimal(0), 2: Decimal(0), 3: Decimal(0)}
+    for batch in batches:
+        for task in batch:
+            expected[task["bankId"]] += task_delta(task)
+    assert _ledger_size(ledger_engine) == 0
+    assert _balances(ledger_engine) == expected
@@ -0,0 +1,109 @@
+import json
+import os
+
+import pytest
+from openpyxl import load_workbook
+
+import excel_service2
+from excel_service2 import create_excel_report2
+
+
+# Cell values and merged ranges of create_excel_report2 before the write-only renderer, the
+# bank columns and the date conversion were added, for _baseline_reportdata()
+BASELINE = os.path.join(os.path.dirname(__file__), "data", "report2_baseline.json")
+BASELINE_DATE_RANGE = ("2025-02-01 00:00:00", "2025-02-28 23:59:59")
+
+
+def _task(date, type_="DEPOSIT", amount=100, code="A385", name="customer", admin="admin"):
+    task = {"date": date, "type": type_, "amount": amount, "name": name,
+            "branchs": {"code": code}, "users": {"name": admin}}
+    if type_ == "WITHDRAW":
+        task["bank2"] = {"name": "ADMINBANK"}
+    return task
+
+def _reportdata(*banks):
+    return {
+        "result": [{"name": f"BANK{number}", "accountNo": str(1000 + number), "totalAmount": 500, "tasks": tasks}
+                   for number, tasks in enumerate(banks)],
+        "branch": [{"code": "A385", "amount": 20}, {"code": "B01", "amount": -5}],
+        "total": {"pendingTotal": 5, "completeTotal": 7, "grandTotal": 12},
+    }
+
+def _baseline_reportdata():
+    reportdata = _reportdata(
+        [_task("2025-02-10T01:00:00.000Z", amount=1500, code="A385"),
+         _task("2025-02-10T16:30:05.000Z", "WITHDRAW", 40, "B01", admin="boss"),
+         _task("2025-02-11T09:15:00.000Z", amount=75.5, code="ZZZ")],
+        [],
+        [_task("2025-02-09T23:59:59.000Z", "WITHDRAW", 300, "K01"),
+         _task("2025-02-10T12:00:00.000Z", amount=20, code="S603", name="someone else"),
+         _task("not a date")],
+    )
+    for number, account in enumerate(reportdata["result"]):
+        account["totalAmount"] = 500 * number
+    reportdata["branch"].append({"code": "K01", "amount": 7})
+    return reportdata
+
+def _values(path):
+    """Cell values as text and merged ranges of the first sheet"""
+    ws = load_workbook(path, rich_text=True).active
+    values = {cell.coordinate: str(cell.value) for row in ws.iter_rows() for cell in row
+              if cell.value is not None and type(cell).__name__ != "MergedCell"}
+    return {"values": values, "merged": sorted(str(merge) for merge in ws.merged_cells.ranges)}
+
+def _sheet(path):
+    """Every written cell's value and style, the merged ranges and the column widths of the first sheet"""
+    ws = load_workbook(path, rich_text=True).active
+    cells = {}
+    for row in ws.iter_rows():
+        for cell in row:
+            if type(cell).__name__ == "MergedCell":
+                cells[cell.coordinate] = ("merged", repr(cell.border))
+            elif cell.value is not None or cell.has_style:
+                cells[cell.coordinate] = (repr(cell.value), repr(cell.fill), repr(cell.border), repr(cell.font),
+                                          repr(cell.alignment), cell.number_format)
+    merged = sorted(str(merge) for merge in ws.merged_cells.ranges)
+    widths = {col: dimension.width for col, dimension in ws.column_dimensions.items()}
+    return cells, merged, widths
+
+def _render_both(tmp_path, monkeypatch, reportdata):
+    monkeypatch.setattr(excel_service2, "REPORTS_DIR", str(tmp_path))
+    in_memory = create_excel_report2("in_memory", reportdata=reportdata)
+    write_only = create_excel_report2("write_only", reportdata=reportdata, write_only=True)
+    return _sheet(tmp_path / in_memory), _sheet(tmp_path / write_only)
+
+@pytest.mark.parametrize("banks", [
+    # Plain banks, one of them without tasks
+    ([_task("2025-02-10T01:00:00.000Z"), _task("2025-02-10T02:00:00.000Z", "WITHDRAW", 40, "B01")], []),
+    # Last task unreadable: TOTAL goes right under the last written row
+    ([_task("2025-02-10T01:00:00.000Z"), _task("2025-02-10T02:00:00.000Z", "WITHDRAW"), _task("not a date")],
+     [_task("2025-02-11T03:00:00.000Z")]),
+    # Unreadable tasks in the middle
+    ([_task("not a date"), _task("2025-02-10T01:00:00.000Z"), _task("bad"), _task("2025-02-10T05:00:00.000Z")],),
+    # Every task unreadable: no TOTAL, like a bank without tasks
+    ([_task("not a date"), _task("bad")], [_task("2025-02-10T01:00:00.000Z")]),
+])
+def test_write_only_matches_in_memory(tmp_path, monkeypatch, banks):
+    in_memory, write_only = _render_both(tmp_path, monkeypatch, _reportdata(*banks))
+    assert write_only == in_memory
+
+def test_total_follows_last_readable_task(tmp_path, monkeypatch):
+    reportdata = _reportdata([_task("2025-02-10T01:00:00.000Z"), _task("2025-02-10T02:00:00.000Z"), _task("bad")])
+    (cells, merged, _), _ = _render_both(tmp_path, monkeypatch, reportdata)
+    assert cells["C6"][0] == "'TOTAL'"
+    assert "C6:D6" in merged
+    assert cells["G1"][0] == "'=SUM(G4:G5)'"
+
+def test_unreadable_bank_has_no_total(tmp_path, monkeypatch):
+    reportdata = _reportdata([_task("bad")])
+    (cells, merged, _), _ = _render_both(tmp_path, monkeypatch, reportdata)
+    assert cells["C1"][0] == "0"
+    assert not any(value[0] == "'TOTAL'" for coordinate, value in cells.items() if coordinate.startswith("C"))
+
+@pytest.mark.parametrize("write_only", [True, False])
+def test_matches_baseline(tmp_path, monkeypatch, write_only):
+    monkeypatch.setattr(excel_service2, "REPORTS_DIR", str(tmp_path))
+    filename = create_excel_report2("baseline", BASELINE_DATE_RANGE, reportdata=_baseline_reportdata(),
+                                    write_only=write_only)
+    with open(BASELINE, encoding="utf-8") as f:
+        assert _values(tmp_path / filename) == json.load(f)
@@ -0,0 +1,68 @@
+import asyncio
+import gzip
+
+import pytest
+
+import report_codec
+from report_codec import BodyTooLarge, DecodeError, decode_body
+
+zstandard = pytest.importorskip("zstandard")
+
+PAYLOAD = b'{"reportdata": {"result": [' + b",".join(b'{"name": "BANK %d", "tasks": []}' % n for n in range(5000)) + b"]}}"
+BOMB = b" " * (256 * 1024 ** 2)
+
+
+def _compress(encoding, data):
+    if encoding == "gzip":
+        return gzip.compress(data)
+    return zstandard.ZstdCompressor().compress(data)
+
+def _pieces(body, encoding, max_bytes, chunk_size=16 * 1024):
+    """Decoded pieces of a body that arrives in chunk_size chunks"""
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    async def collect():
+        return [piece async for piece in decode_body(chunks(), encoding, max_bytes)]
+    return asyncio.run(collect())
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_round_trip(encoding):
+    assert b"".join(_pieces(_compress(encoding, PAYLOAD), encoding, 10 * 1024 ** 2)) == PAYLOAD
+
+def test_identity():
+    assert b"".join(_pieces(PAYLOAD, None, 10 * 1024 ** 2)) == PAYLOAD
+    with pytest.raises(BodyTooLarge):
+        _pieces(PAYLOAD, "identity", len(PAYLOAD) - 1)
+
+@pytest.mark.parametrize("encoding, largest", [("gzip", report_codec.DECOMPRESS_CHUNK), ("zstd", 3 * 1024 ** 2)])
+def test_pieces_are_bounded(encoding, largest):
+    pieces = _pieces(_compress(encoding, BOMB[:32 * 1024 ** 2]), encoding, 64 * 1024 ** 2)
+    assert sum(map(len, pieces)) == 32 * 1024 ** 2
+    assert max(map(len, pieces)) <= largest
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_bomb_stops_at_limit(encoding):
+    body = _compress(encoding, BOMB)
+    seen = []
+
+    async def chunks():
+        yield body
+
+    async def collect():
+        async for piece in decode_body(chunks(), encoding, 10 * 1024 ** 2):
+            seen.append(len(piece))
+    with pytest.raises(BodyTooLarge):
+        asyncio.run(collect())
+    # Stopped within one bounded piece of the limit, not after inflating the whole body
+    assert sum(seen) <= 10 * 1024 ** 2
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_truncated_body(encoding):
+    with pytest.raises(DecodeError):
+        _pieces(_compress(encoding, PAYLOAD)[:-20], encoding, 10 * 1024 ** 2)
+
+def test_unsupported_encoding():
+    with pytest.raises(report_codec.UnsupportedBody):
+        _pieces(PAYLOAD, "br", 10 * 1024 ** 2)
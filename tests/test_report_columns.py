@@ -0,0 +1,19 @@
+from report_columns import BankColumns
+
+
+def _account(*amounts):
+    return {"name": "BANK", "tasks": [{"date": "2025-02-11T01:30:00Z", "type": "DEPOSIT", "amount": amount}
+                                      for amount in amounts]}
+
+def test_int_amounts_stay_ints():
+    amounts = BankColumns(_account(100, 250)).amounts
+    assert list(amounts) == [100, 250]
+    assert all(type(amount) is int for amount in amounts)
+
+def test_float_amounts_stay_floats():
+    assert list(BankColumns(_account(100.5, 0.25)).amounts) == [100.5, 0.25]
+
+def test_mixed_amounts_keep_their_types():
+    amounts = BankColumns(_account(100, 2.5, "300", None)).amounts
+    assert amounts == [100, 2.5, "300", None]
+    assert type(amounts[0]) is int
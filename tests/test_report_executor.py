@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from report_executor import ReportExecutor, ReportQueueFull, BrokenProcessPool
+
+
+@pytest.fixture
+def executor():
+    executor = ReportExecutor(max_workers=1, queue_limit=1)
+    yield executor
+    executor.shutdown()
+
+def test_runs_jobs(executor):
+    assert executor.submit(pow, 2, 10).result(timeout=60) == 1024
+
+def test_rejects_past_queue_limit(executor):
+    executor._pending = executor.max_workers + executor.queue_limit
+    with pytest.raises(ReportQueueFull):
+        executor.submit(pow, 2, 10)
+
+def test_recovers_after_worker_dies(executor):
+    # What the OOM killer does to a worker rendering a large report
+    crashed = executor.submit(os._exit, 1)
+    with pytest.raises(BrokenProcessPool):
+        crashed.result(timeout=60)
+    assert executor.submit(pow, 2, 10).result(timeout=60) == 1024
+    assert executor.submit(pow, 3, 2).result(timeout=60) == 9
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import data_service
+import report_snapshot
+from benchmark import DATE_RANGE, make_reportdata, make_sqlite_db
+from report_snapshot import SnapshotTask, expire_snapshots, refresh_snapshot
+
+LATE = datetime(2025, 2, 11, 23, 59, 30)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """data_service pointed at a SQLite stand-in of the production schema, snapshots kept in tmp_path"""
+    path = tmp_path / "report.sqlite3"
+    make_sqlite_db(make_reportdata(banks=3, tasks_per_bank=20, branch_codes=["A385", "B01"], seed=3), path)
+    engine = create_engine(f"sqlite:///{path}", connect_args={"detect_types": sqlite3.PARSE_DECLTYPES})
+    monkeypatch.setattr(data_service, "engine", engine)
+    monkeypatch.setattr(report_snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    yield engine
+    engine.dispose()
+
+def _rows(banks):
+    return [(bank_id, [tuple(getattr(task, field) for field in SnapshotTask._fields) for task in tasks])
+            for bank_id, tasks in banks]
+
+def _full_rebuild():
+    return _rows(data_service.iter_transactions_by_bank(DATE_RANGE))
+
+def _complete_task_ids(engine, count):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT id FROM Task WHERE status = 'COMPLETE' ORDER BY id LIMIT :count"),
+                            {"count": count}).scalars().all()
+
+def _execute(engine, statement, **params):
+    with engine.begin() as conn:
+        conn.execute(text(statement), params)
+
+def test_first_refresh_matches_full_query(engine):
+    assert _rows(refresh_snapshot(DATE_RANGE).iter_banks()) == _full_rebuild()
+
+def test_incremental_refresh_matches_full_rebuild(engine):
+    refresh_snapshot(DATE_RANGE)
+    updated, moved, left_range, soft_deleted = _complete_task_ids(engine, 4)
+    _execute(engine, """
+        INSERT INTO Task (id, bankId, branchId, amount, type, name, status, reason, updatedAt)
+        VALUES ('new1', 2, 1, 500, 'DEPOSIT', 'New customer', 'COMPLETE', '', :updated_at)
+    """, updated_at=LATE)
+    _execute(engine, "UPDATE Task SET amount = 12345, updatedAt = :updated_at WHERE id = :id",
+             id=updated, updated_at=LATE)
+    _execute(engine, "UPDATE Task SET bankId = CASE bankId WHEN 3 THEN 1 ELSE bankId + 1 END, "
+                     "updatedAt = :updated_at WHERE id = :id", id=moved, updated_at=LATE)
+    _execute(engine, "UPDATE Task SET updatedAt = :updated_at WHERE id = :id",
+             id=left_range, updated_at=LATE + timedelta(minutes=5))
+    _execute(engine, "UPDATE Task SET isDelete = 1, updatedAt = :updated_at WHERE id = :id",
+             id=soft_deleted, updated_at=LATE)
+
+    snapshot = refresh_snapshot(DATE_RANGE)
+
+    assert _rows(snapshot.iter_banks()) == _full_rebuild()
+    assert snapshot.bank_of["new1"] == 2
+    assert snapshot.banks[snapshot.bank_of[updated]][updated].amount == 12345
+    assert left_range not in snapshot.bank_of and soft_deleted not in snapshot.bank_of
+
+def test_hard_delete_is_dropped_by_the_rebuild(engine, monkeypatch):
+    refresh_snapshot(DATE_RANGE)
+    (deleted,) = _complete_task_ids(engine, 1)
+    _execute(engine, "DELETE FROM Task WHERE id = :id", id=deleted)
+    # A hard delete leaves no changed row for an incremental refresh to see
+    assert deleted in refresh_snapshot(DATE_RANGE).bank_of
+
+    monkeypatch.setattr(report_snapshot, "SNAPSHOT_REBUILD_SECONDS", 0)
+    snapshot = refresh_snapshot(DATE_RANGE)
+    assert deleted not in snapshot.bank_of
+    assert _rows(snapshot.iter_banks()) == _full_rebuild()
+
+def test_expire_snapshots_removes_only_stale_files(engine):
+    refresh_snapshot(DATE_RANGE)
+    fresh = report_snapshot._snapshot_path(DATE_RANGE)
+    stale = os.path.join(report_snapshot.SNAPSHOT_DIR, "stale.pickle")
+    leftover = f"{stale}.1234.tmp"
+    for path in (stale, leftover):
+        with open(path, "wb") as f:
+            f.write(b"x")
+        an_hour_ago = time.time() - 3600
+        os.utime(path, (an_hour_ago, an_hour_ago))
+
+    assert expire_snapshots(max_age=60) == 2
+    assert os.listdir(report_snapshot.SNAPSHOT_DIR) == [os.path.basename(fresh)]
@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from task_dates import convert_task_dates
+
+
+def test_converts_to_malaysia_time():
+    values = ["2025-02-11T01:30:00Z", "2025-02-11T09:30:00+08:00", datetime(2025, 2, 11, 16, 0, 5)]
+    assert convert_task_dates(values) == (
+        ["11-02-2025", "11-02-2025", "12-02-2025"],
+        ["09:30:00", "09:30:00", "00:00:05"],
+    )
+
+def test_empty_values_give_empty_strings():
+    assert convert_task_dates([None, ""]) == (["", ""], ["", ""])
+
+@pytest.mark.parametrize("value", ["11/02/2025", 1739236800000, 1739236800.5, ["2025-02-11"]])
+def test_unparseable_values_give_none(value):
+    assert convert_task_dates([value, datetime(2025, 2, 11, tzinfo=timezone.utc)]) == (
+        [None, "11-02-2025"],
+        [None, "08:00:00"],
+    )
@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+import data_service
+import task_service
+from task_service import create_tasks
+
+
+def _task(task_id, bank_id=1, amount=100, type_="DEPOSIT"):
+    return {"id": task_id, "bankId": bank_id, "amount": amount, "type": type_, "status": "COMPLETE"}
+
+def _counts(engine):
+    with engine.connect() as conn:
+        return (conn.execute(text("SELECT COUNT(*) FROM Task")).scalar(),
+                conn.execute(text("SELECT COUNT(*) FROM BankBalanceDelta")).scalar())
+
+def test_create_tasks_records_tasks_and_deltas(ledger_engine):
+    result = create_tasks([_task("t1", 1, 100), _task("t2", 1, "40.50", "WITHDRAW"), _task("t3", 2, 7)])
+    assert result["created"] == 3
+    assert {bank_id: float(delta) for bank_id, delta in result["balances"].items()} == {1: 59.5, 2: 7}
+    assert _counts(ledger_engine) == (3, 3)
+
+@pytest.mark.parametrize("bad_task, error", [
+    (_task("bad", amount="12abc"), ValueError),
+    (_task("bad", type_="REFUND"), ValueError),
+    (_task("bad", bank_id=99), ValueError),
+    (_task("existing"), IntegrityError),
+])
+def test_one_bad_task_creates_nothing(ledger_engine, bad_task, error):
+    task_service.create_task(_task("existing", 3, 5))
+    # The bad task comes last, after a whole insert chunk of good ones has been written
+    batch = [_task(f"t{number}", 1 + number % 2) for number in range(task_service.INSERT_BATCH_SIZE + 1)]
+    with pytest.raises(error):
+        create_tasks(batch + [bad_task])
+    assert _counts(ledger_engine) == (1, 1)
+
+@pytest.mark.parametrize("create_task", [task_service.create_task, data_service.create_task])
+@pytest.mark.parametrize("bad_task", [_task("bad", type_="REFUND"), _task("bad", type_=None), _task("bad", amount="x")])
+def test_create_task_validates_like_the_batch(ledger_engine, create_task, bad_task):
+    with pytest.raises(ValueError):
+        create_task(bad_task)
+    assert _counts(ledger_engine) == (0, 0)